@@ -283,4 +283,1820 @@ if __name__ == "__main__":
     # 为模拟网络延时添加休眠
     time.sleep(1)
     example_usage()
-    print("\nIntegration example completed.")
\ No newline at end of file
+    print("\nIntegration example completed.")
+
+
+
+# 【例2-6】
+# 生产环境Slot: __slots__紧凑存储、不可变、缓存序列化结果
+import sys
+import json
+import time
+import random
+from types import MappingProxyType
+
+class Slot:
+    __slots__ = ("role", "content", "name", "options", "_encoded")
+
+    def __init__(self, role, content, name=None, options=None):
+        # role取值有限, intern后所有Slot共享同一个字符串对象
+        object.__setattr__(self, "role", sys.intern(role))
+        object.__setattr__(self, "content", content)
+        object.__setattr__(self, "name", name)
+        # 只读视图, 防止外部修改options导致缓存失效
+        object.__setattr__(self, "options", MappingProxyType(dict(options or {})))
+        object.__setattr__(self, "_encoded", None)
+
+    def __setattr__(self, key, value):
+        raise AttributeError("Slot对象不可变, 请创建新的Slot")
+
+    def __delattr__(self, key):
+        raise AttributeError("Slot对象不可变, 请创建新的Slot")
+
+    def to_dict(self):
+        # 与例2-5保持相同的字段与省略规则
+        slot_dict = {"role": self.role, "content": self.content}
+        if self.name:
+            slot_dict["name"] = self.name
+        if self.options:
+            slot_dict["options"] = dict(self.options)
+        return slot_dict
+
+    def to_json(self):
+        """
+        返回UTF-8编码的JSON字节, 首次调用后缓存
+        """
+        encoded = self._encoded
+        if encoded is None:
+            encoded = json.dumps(self.to_dict(), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+            object.__setattr__(self, "_encoded", encoded)
+        return encoded
+
+    def __eq__(self, other):
+        return isinstance(other, Slot) and self.to_json() == other.to_json()
+
+    def __hash__(self):
+        return hash(self.to_json())
+
+    def __repr__(self):
+        tag = f"{self.role.upper()}" + (f" - {self.name}" if self.name else "")
+        return f"[{tag}]\n{self.content}\n"
+
+class MCPClient:
+    def __init__(self, model="gpt-4-turbo", max_tokens=512, temperature=0.7):
+        self.model = model
+        self.max_tokens = max_tokens
+        self.temperature = temperature
+        self.request_id = random.randint(1000, 9999)
+
+    def _default_options(self, options):
+        return options or {"max_tokens": self.max_tokens, "temperature": self.temperature}
+
+    def build_request(self, slots, tools=None, options=None):
+        """
+        与例2-5相同的字典结构, 便于调试打印
+        """
+        request_message = {
+            "jsonrpc": "2.0",
+            "id": self.request_id,
+            "method": "mcp/invoke",
+            "params": {
+                "slots": [slot.to_dict() for slot in slots],
+                "options": self._default_options(options)
+            }
+        }
+        if tools:
+            request_message["params"]["tools"] = tools
+        return request_message
+
+    def build_request_bytes(self, slots, tools=None, options=None):
+        """
+        直接拼接各Slot缓存的JSON字节, 历史Slot不再重复编码
+        :return: 可直接写入传输层的请求字节
+        """
+        dumps = lambda obj: json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        parts = [
+            b'{"jsonrpc":"2.0","id":', dumps(self.request_id),
+            b',"method":"mcp/invoke","params":{"slots":[',
+            b",".join(slot.to_json() for slot in slots),
+            b'],"options":', dumps(self._default_options(options))
+        ]
+        if tools:
+            parts += [b',"tools":', dumps(tools)]
+        parts.append(b"}}")
+        return b"".join(parts)
+
+# 例2-5风格的普通Slot, 用于对比
+class PlainSlot:
+    def __init__(self, role, content, name=None, options=None):
+        self.role = role
+        self.content = content
+        self.name = name
+        self.options = options or {}
+
+    def to_dict(self):
+        slot_dict = {"role": self.role, "content": self.content}
+        if self.name:
+            slot_dict["name"] = self.name
+        if self.options:
+            slot_dict["options"] = self.options
+        return slot_dict
+
+def example_usage():
+    client = MCPClient(max_tokens=512, temperature=0.6)
+    history = []
+    plain_history = []
+    for i in range(2000):
+        role = "user" if i % 2 == 0 else "assistant"
+        text = f"第{i}轮对话内容：MCP协议如何管理上下文Slot？"
+        history.append(Slot(role, text, options={"persistent": True}))
+        plain_history.append(PlainSlot(role, text, options={"persistent": True}))
+
+    # 结构与例2-5的字典版本完全一致
+    request_bytes = client.build_request_bytes(history[:3], tools=[{"name": "KnowledgeRetriever"}])
+    request_dict = client.build_request(history[:3], tools=[{"name": "KnowledgeRetriever"}])
+    assert json.loads(request_bytes) == request_dict
+    print("=== Pre-encoded MCP Request ===")
+    print(request_bytes.decode("utf-8"))
+
+    # 内存占用对比(仅对象本身, 不含共享的content字符串)
+    slot_size = sys.getsizeof(history[0])
+    plain_size = sys.getsizeof(plain_history[0]) + sys.getsizeof(plain_history[0].__dict__)
+    print(f"\n__slots__ Slot: {slot_size} bytes, 普通Slot: {plain_size} bytes")
+
+    # 模拟多轮对话: 每轮追加一条Slot并重新构造整个请求
+    rounds = 50
+    start = time.perf_counter()
+    for r in range(rounds):
+        json.dumps(client.build_request(plain_history[:1000 + r]), ensure_ascii=False).encode("utf-8")
+    plain_cost = time.perf_counter() - start
+    start = time.perf_counter()
+    for r in range(rounds):
+        client.build_request_bytes(history[:1000 + r])
+    cached_cost = time.perf_counter() - start
+    print(f"{rounds}轮请求构造: to_dict+json.dumps {plain_cost * 1000:.1f} ms, "
+          f"缓存字节拼接 {cached_cost * 1000:.1f} ms")
+
+if __name__ == "__main__":
+    example_usage()
+
+
+
+# 【例2-7】
+# 增量Prompt构造: 稳定Slot前置, 只重新渲染变化的Slot
+import json
+import random
+
+# 稳定角色前置, 使Prompt前缀在多轮间保持不变, 便于服务端前缀缓存命中
+STABLE_ROLES = {"system", "memory"}
+
+class IncrementalPromptBuilder:
+    def __init__(self):
+        self._keys = []       # 上一轮各行对应的Slot键
+        self._ends = []       # 上一轮各行在Prompt中的结束偏移
+        self._prompt = ""     # 上一轮完整Prompt
+        self._rendered = {}   # Slot键 -> 渲染后的行文本
+        self.last_stats = {}
+
+    @staticmethod
+    def _slot_key(slot):
+        return (slot.get("role", ""), slot.get("name", ""), slot.get("content", ""))
+
+    @staticmethod
+    def _render(key):
+        role, name, content = key
+        # 与例2-5 compose_prompt相同的格式：[Role - Name]: Content
+        if name:
+            return f"[{role} - {name}]: {content}"
+        return f"[{role}]: {content}"
+
+    def compose(self, slots_list):
+        """
+        :param slots_list: 包含各Slot字典的列表
+        :return: 拼接后的Prompt文本; 统计信息保存在last_stats
+        """
+        # 只分成稳定/其余两组, 组内保持原有先后顺序, 对话中的问答次序不被打乱
+        ordered = ([s for s in slots_list if s.get("role", "") in STABLE_ROLES] +
+                   [s for s in slots_list if s.get("role", "") not in STABLE_ROLES])
+        keys = [self._slot_key(s) for s in ordered]
+
+        # 与上一轮比较, 找出未变化的最长前缀
+        common = 0
+        for old, new in zip(self._keys, keys):
+            if old != new:
+                break
+            common += 1
+        prefix_len = self._ends[common - 1] if common else 0
+
+        rendered = {}
+        reused_chars = prefix_len
+        rerendered_chars = 0
+        parts = [self._prompt[:prefix_len]] if common else []
+        ends = self._ends[:common]
+        offset = prefix_len
+        for i in range(common, len(keys)):
+            key = keys[i]
+            line = self._rendered.get(key) or rendered.get(key)
+            if line is None:
+                line = self._render(key)
+                rerendered_chars += len(line)
+            else:
+                reused_chars += len(line)
+            rendered[key] = line
+            if i:
+                parts.append("\n")
+                offset += 1
+            parts.append(line)
+            offset += len(line)
+            ends.append(offset)
+        for key in keys[:common]:
+            rendered[key] = self._rendered[key]
+
+        prompt = "".join(parts)
+        # 只保留本轮用到的渲染结果, 缓存大小随当前上下文而非历史增长
+        self._rendered = rendered
+        self._keys, self._ends, self._prompt = keys, ends, prompt
+        stable_count = sum(1 for k in keys if k[0] in STABLE_ROLES)
+        self.last_stats = {
+            "total_chars": len(prompt),
+            "stable_prefix_chars": prefix_len,
+            "reused_chars": reused_chars,
+            "rerendered_chars": rerendered_chars,
+            "stable_slots": stable_count,
+            "volatile_slots": len(keys) - stable_count
+        }
+        return prompt
+
+class MCPClient:
+    def __init__(self, model="gpt-4-turbo", max_tokens=512, temperature=0.7):
+        self.model = model
+        self.max_tokens = max_tokens
+        self.temperature = temperature
+        self.request_id = random.randint(1000, 9999)
+        self.prompt_builder = IncrementalPromptBuilder()
+
+    def build_request(self, slots, tools=None, options=None):
+        request_message = {
+            "jsonrpc": "2.0",
+            "id": self.request_id,
+            "method": "mcp/invoke",
+            "params": {
+                "slots": slots,
+                "options": options or {"max_tokens": self.max_tokens, "temperature": self.temperature}
+            }
+        }
+        if tools:
+            request_message["params"]["tools"] = tools
+        return request_message
+
+    def compose_prompt(self, slots_list):
+        """
+        替代例2-5中每次全量拼接的compose_prompt
+        """
+        return self.prompt_builder.compose(slots_list)
+
+def example_usage():
+    client = MCPClient()
+    system_slot = {"role": "system", "content": "提供详细的技术说明，并结合实际案例。", "name": "Instruction"}
+    memory_slot = {"role": "memory", "content": "MCP协议在上下文管理和语义注入方面具有创新意义。", "name": "MemoryNote"}
+    history = []
+    questions = [
+        "请解释一下MCP协议如何提高大模型应用的灵活性。",
+        "Slot机制和普通Prompt拼接相比有什么优势？",
+        "如何在多轮对话中控制上下文长度？"
+    ]
+    for turn, question in enumerate(questions):
+        tool_slot = {"role": "tool", "content": f"第{turn}轮检索到{turn + 2}条相关文档摘要。", "name": "KnowledgeDB"}
+        user_slot = {"role": "user", "content": question}
+        # system/memory混在对话之后传入也会被移到最前; 历史问答与本轮Slot保持给定顺序
+        slots = history + [system_slot, memory_slot, tool_slot, user_slot]
+        request_message = client.build_request(slots)
+        prompt = client.compose_prompt(request_message["params"]["slots"])
+        print(f"=== Turn {turn} ===")
+        print(prompt)
+        print(json.dumps(client.prompt_builder.last_stats, ensure_ascii=False))
+        history += [user_slot, {"role": "assistant", "content": f"第{turn}轮回答摘要"}]
+
+if __name__ == "__main__":
+    example_usage()
+
+
+
+# 【例2-8】
+# Token预算管理: 在发起网络调用前, 按角色优先级与生命周期属性裁剪Slot
+import re
+import json
+import random
+from functools import lru_cache
+
+# 简化分词: 中文按字, 英文/数字按词, 其余符号单独计数
+# 真实场景可替换为模型对应的分词器(如tiktoken), 接口保持不变
+_TOKEN_PATTERN = re.compile(r"[\u4e00-\u9fff]|[A-Za-z0-9_]+|[^\sA-Za-z0-9_\u4e00-\u9fff]")
+
+@lru_cache(maxsize=4096)
+def count_tokens(text):
+    # 多轮对话中历史Slot内容不变, 缓存后每轮只需统计新增Slot
+    return len(_TOKEN_PATTERN.findall(text))
+
+def truncate_to_tokens(text, max_tokens):
+    if max_tokens <= 0:
+        return ""
+    for i, match in enumerate(_TOKEN_PATTERN.finditer(text)):
+        if i == max_tokens:
+            return text[:match.start()].rstrip() + "…"
+    return text
+
+# 每个Slot的角色标记等额外开销
+SLOT_OVERHEAD_TOKENS = 4
+# 优先级越小越先被裁剪
+ROLE_PRIORITY = {"tool": 0, "memory": 1, "assistant": 2, "user": 3, "system": 4}
+
+class TokenBudgetExceeded(Exception):
+    def __init__(self, report):
+        self.report = report
+        super().__init__(f"受保护Slot已超出预算: {report['after_tokens']} > {report['budget']}")
+
+class Slot:
+    def __init__(self, role, content, name=None, options=None):
+        self.role = role
+        self.content = content
+        self.name = name
+        self.options = options or {}
+
+    def to_dict(self):
+        slot_dict = {"role": self.role, "content": self.content}
+        if self.name:
+            slot_dict["name"] = self.name
+        if self.options:
+            slot_dict["options"] = self.options
+        return slot_dict
+
+class TokenBudgetManager:
+    def __init__(self, context_window=4096, tokenizer=count_tokens):
+        self.context_window = context_window
+        self.tokenizer = tokenizer
+
+    def slot_tokens(self, slot):
+        return self.tokenizer(slot.content) + SLOT_OVERHEAD_TOKENS
+
+    def fit(self, slots, max_tokens):
+        """
+        裁剪顺序:
+          1. ephemeral Slot, 再按角色优先级、从旧到新删除(persistent、system与最后一条user不删除)
+          2. 仍超出时截断内容, persistent Slot也可被截断
+          3. 仍超出时抛出TokenBudgetExceeded, 不发起网络调用
+        :return: (裁剪后的Slot列表, 报告)
+        """
+        budget = self.context_window - max_tokens
+        tokens = [self.slot_tokens(s) for s in slots]
+        total = sum(tokens)
+        report = {"budget": budget, "before_tokens": total, "dropped": [], "truncated": []}
+
+        last_user = max((i for i, s in enumerate(slots) if s.role == "user"), default=-1)
+        protected = {i for i, s in enumerate(slots) if s.role == "system" or i == last_user}
+
+        def order(i):
+            s = slots[i]
+            return (0 if s.options.get("ephemeral") else 1, ROLE_PRIORITY.get(s.role, 0), i)
+
+        kept = list(range(len(slots)))
+        droppable = sorted(
+            (i for i in kept if i not in protected and not slots[i].options.get("persistent")),
+            key=order
+        )
+        for i in droppable:
+            if total <= budget:
+                break
+            kept.remove(i)
+            total -= tokens[i]
+            report["dropped"].append({"index": i, "role": slots[i].role, "name": slots[i].name,
+                                      "tokens": tokens[i]})
+
+        result = {i: slots[i] for i in kept}
+        truncatable = sorted((i for i in kept if i not in protected), key=order) + \
+            sorted(protected, key=lambda i: -tokens[i])
+        for i in truncatable:
+            if total <= budget:
+                break
+            excess = total - budget
+            content_tokens = tokens[i] - SLOT_OVERHEAD_TOKENS
+            # 预留1个token给截断标记"…"
+            keep = max(content_tokens - excess - 1, 0)
+            s = slots[i]
+            if keep == 0 and i not in protected:
+                # 截断后为空的Slot直接删除, 连同角色标记开销一起释放
+                del result[i]
+                total -= tokens[i]
+                report["dropped"].append({"index": i, "role": s.role, "name": s.name, "tokens": tokens[i]})
+                continue
+            result[i] = Slot(s.role, truncate_to_tokens(s.content, keep), s.name, s.options)
+            new_tokens = self.slot_tokens(result[i])
+            total -= tokens[i] - new_tokens
+            report["truncated"].append({"index": i, "role": s.role, "name": s.name,
+                                        "from_tokens": tokens[i], "to_tokens": new_tokens})
+
+        report["after_tokens"] = total
+        if total > budget:
+            raise TokenBudgetExceeded(report)
+        return [result[i] for i in sorted(result)], report
+
+class MCPClient:
+    def __init__(self, model="gpt-4-turbo", max_tokens=512, temperature=0.7, context_window=4096):
+        self.model = model
+        self.max_tokens = max_tokens
+        self.temperature = temperature
+        self.request_id = random.randint(1000, 9999)
+        self.budget_manager = TokenBudgetManager(context_window)
+        self.last_budget_report = None
+
+    def build_request(self, slots, tools=None, options=None):
+        """
+        在构造请求前先完成预算裁剪, 超出预算的请求不会被发送
+        """
+        options = options or {"max_tokens": self.max_tokens, "temperature": self.temperature}
+        fitted, report = self.budget_manager.fit(slots, options.get("max_tokens", self.max_tokens))
+        self.last_budget_report = report
+        request_message = {
+            "jsonrpc": "2.0",
+            "id": self.request_id,
+            "method": "mcp/invoke",
+            "params": {
+                "slots": [slot.to_dict() for slot in fitted],
+                "options": options
+            }
+        }
+        if tools:
+            request_message["params"]["tools"] = tools
+        return request_message
+
+def example_usage():
+    client = MCPClient(max_tokens=256, context_window=400)
+    slots = [
+        Slot("system", "提供详细的技术说明，并结合实际案例。", name="Instruction"),
+        Slot("memory", "用户上次查询：AI绘画工具使用说明。" * 3, name="MemoryNote", options={"persistent": True}),
+        Slot("tool", "调用结果：已检索到3条绘画插件推荐。" * 4, name="Search", options={"ephemeral": True}),
+        Slot("tool", "已从企业知识库中检索到相关技术文档摘要。" * 3, name="KnowledgeDB"),
+        Slot("assistant", "上一轮回答：推荐了Stable Diffusion与Midjourney。"),
+        Slot("user", "继续推荐更多AI图像生成方案，并比较各自的优缺点。")
+    ]
+    request_message = client.build_request(slots)
+    print("=== Budget Report ===")
+    print(json.dumps(client.last_budget_report, indent=2, ensure_ascii=False))
+    print("=== Fitted MCP Request ===")
+    print(json.dumps(request_message, indent=2, ensure_ascii=False))
+
+    # 预算更紧时, persistent的memory Slot也会被截断
+    client.budget_manager.context_window = 340
+    client.build_request(slots)
+    print("=== Budget Report (context_window=340) ===")
+    print(json.dumps(client.last_budget_report, indent=2, ensure_ascii=False))
+
+    try:
+        MCPClient(max_tokens=256, context_window=260).build_request(slots)
+    except TokenBudgetExceeded as e:
+        print("请求未发送:", e)
+
+if __name__ == "__main__":
+    example_usage()
+
+
+
+# 【例2-9】
+# 异步连接池模型客户端: 并发上限、429/5xx抖动退避重试、单次调用超时, 附带本地模拟模型服务
+import os
+import json
+import time
+import random
+import asyncio
+
+import httpx
+
+# 需要重试的HTTP状态码
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+class LocalModelServer:
+    """
+    本地模拟的Chat Completions服务(HTTP/1.1 keep-alive), 用于离线压测
+    latency: 模拟推理耗时; failure_rate: 随机返回429/503的比例
+    """
+    def __init__(self, host="127.0.0.1", port=8765, latency=0.05, failure_rate=0.05):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.connections = 0
+        self.requests = 0
+        self.server = None
+
+    async def start(self):
+        self.server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def _handle_connection(self, reader, writer):
+        self.connections += 1
+        try:
+            while True:
+                header = await reader.readuntil(b"\r\n\r\n")
+                lines = header.decode("latin-1").split("\r\n")
+                headers = {}
+                for line in lines[1:]:
+                    if ":" in line:
+                        k, v = line.split(":", 1)
+                        headers[k.strip().lower()] = v.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+                self.requests += 1
+                status, payload = await self._complete(json.loads(body or b"{}"))
+                data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+                reason = {200: "OK", 429: "Too Many Requests", 503: "Service Unavailable"}[status]
+                extra = "Retry-After: 0.05\r\n" if status == 429 else ""
+                writer.write(
+                    f"HTTP/1.1 {status} {reason}\r\nContent-Type: application/json\r\n"
+                    f"Content-Length: {len(data)}\r\n{extra}Connection: keep-alive\r\n\r\n".encode("latin-1") + data
+                )
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionResetError):
+            pass
+        finally:
+            writer.close()
+
+    async def _complete(self, request):
+        await asyncio.sleep(self.latency * random.uniform(0.5, 1.5))
+        if random.random() < self.failure_rate:
+            status = random.choice([429, 503])
+            return status, {"error": {"message": "mock overload", "code": status}}
+        prompt = request.get("messages", [{}])[-1].get("content", "")
+        return 200, {
+            "id": f"chatcmpl-{random.randint(100000, 999999)}",
+            "model": request.get("model"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": f"[MockModel] 已收到{len(prompt)}字的上下文。"}}],
+            "usage": {"prompt_tokens": len(prompt), "completion_tokens": 16}
+        }
+
+class AsyncModelClient:
+    """
+    基于httpx.AsyncClient连接池的异步模型客户端
+    """
+    def __init__(self, base_url, api_key="", max_connections=20, max_concurrency=None,
+                 timeout=30.0, max_retries=3, backoff_base=0.1, backoff_max=2.0):
+        self.http = httpx.AsyncClient(
+            base_url=base_url,
+            headers={"Authorization": f"Bearer {api_key}"} if api_key else {},
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            timeout=httpx.Timeout(timeout)
+        )
+        # 并发上限(默认等于连接数): 超出的调用在信号量处排队, 而不是压垮上游或堆积在连接池内部
+        self.semaphore = asyncio.Semaphore(max_concurrency or max_connections)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.stats = {"calls": 0, "retries": 0, "failures": 0}
+
+    def _backoff(self, attempt, retry_after=None):
+        # Full Jitter: 在[0, min(上限, base*2^attempt)]内均匀随机, 避免重试同步放大拥塞
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+        if retry_after:
+            try:
+                delay = max(delay, float(retry_after))
+            except ValueError:
+                pass
+        return delay
+
+    async def chat(self, messages, model, max_tokens, temperature, timeout=None):
+        """
+        :param timeout: 单次调用超时(秒), 覆盖客户端默认值
+        :return: Chat Completions响应JSON
+        """
+        payload = {"model": model, "messages": messages, "max_tokens": max_tokens, "temperature": temperature}
+        async with self.semaphore:
+            self.stats["calls"] += 1
+            for attempt in range(self.max_retries + 1):
+                retry_after = None
+                try:
+                    resp = await self.http.post("/chat/completions", json=payload,
+                                                timeout=timeout if timeout is not None else httpx.USE_CLIENT_DEFAULT)
+                    if resp.status_code not in RETRY_STATUS:
+                        resp.raise_for_status()
+                        return resp.json()
+                    retry_after = resp.headers.get("retry-after")
+                    error = httpx.HTTPStatusError(f"HTTP {resp.status_code}", request=resp.request, response=resp)
+                except (httpx.TimeoutException, httpx.TransportError) as e:
+                    error = e
+                if attempt == self.max_retries:
+                    self.stats["failures"] += 1
+                    raise error
+                self.stats["retries"] += 1
+                await asyncio.sleep(self._backoff(attempt, retry_after))
+
+    async def aclose(self):
+        await self.http.aclose()
+
+class AsyncMCPClient:
+    """
+    例2-5 MCPClient的异步版本, call_model改为通过连接池并发调用
+    """
+    def __init__(self, model_client, model="gpt-4-turbo", max_tokens=512, temperature=0.7):
+        self.model_client = model_client
+        self.model = model
+        self.max_tokens = max_tokens
+        self.temperature = temperature
+        self.request_id = random.randint(1000, 9999)
+
+    def build_request(self, slots, tools=None, options=None):
+        request_message = {
+            "jsonrpc": "2.0",
+            "id": self.request_id,
+            "method": "mcp/invoke",
+            "params": {
+                "slots": slots,
+                "options": options or {"max_tokens": self.max_tokens, "temperature": self.temperature}
+            }
+        }
+        if tools:
+            request_message["params"]["tools"] = tools
+        return request_message
+
+    def compose_prompt(self, slots_list):
+        prompt_parts = []
+        for slot in slots_list:
+            role = slot.get("role", "")
+            name = slot.get("name", "")
+            content = slot.get("content", "")
+            if name:
+                prompt_parts.append(f"[{role} - {name}]: {content}")
+            else:
+                prompt_parts.append(f"[{role}]: {content}")
+        return "\n".join(prompt_parts)
+
+    async def call_model(self, request_message, timeout=None):
+        prompt = self.compose_prompt(request_message["params"]["slots"])
+        messages = [
+            {"role": "system", "content": "You are an AI assistant integrating MCP protocol."},
+            {"role": "user", "content": prompt}
+        ]
+        try:
+            response = await self.model_client.chat(messages, self.model, self.max_tokens,
+                                                    self.temperature, timeout=timeout)
+            return response["choices"][0]["message"]["content"]
+        except Exception as e:
+            return f"Error calling model: {e!r}"
+
+async def load_test(sessions=300, base_url=None):
+    """
+    默认启动本地模拟服务; 设置base_url可指向真实的OpenAI兼容接口
+    """
+    server = None
+    if base_url is None:
+        server = LocalModelServer()
+        await server.start()
+        base_url = f"http://{server.host}:{server.port}"
+    model_client = AsyncModelClient(base_url, api_key=os.getenv("OPENAI_API_KEY", "mock-key"),
+                                    max_connections=20, timeout=5.0)
+
+    async def one_session(i):
+        client = AsyncMCPClient(model_client, max_tokens=128, temperature=0.6)
+        slots = [
+            {"role": "system", "content": "提供详细的技术说明，并结合实际案例。", "name": "Instruction"},
+            {"role": "user", "content": f"会话{i}: 请解释一下MCP协议如何提高大模型应用的灵活性。"}
+        ]
+        return await client.call_model(client.build_request(slots))
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*[one_session(i) for i in range(sessions)])
+    elapsed = time.perf_counter() - start
+    await model_client.aclose()
+    errors = sum(1 for r in results if r.startswith("Error calling model"))
+    print(f"sessions={sessions}, elapsed={elapsed:.2f}s, throughput={sessions / elapsed:.1f} calls/s")
+    print(f"client stats={model_client.stats}, errors={errors}")
+    if server:
+        print(f"server: connections={server.connections}, requests={server.requests}")
+        await server.stop()
+    print("示例响应:", results[0])
+
+if __name__ == "__main__":
+    asyncio.run(load_test(sessions=300))
+
+
+
+# 【例2-10】
+# 流式调用模型: 以异步生成器逐段返回内容, 结束后拼装完整消息并记录首Token时延与生成速率
+import os
+import json
+import time
+import random
+import asyncio
+from contextlib import aclosing
+
+import httpx
+
+class LocalStreamingModelServer:
+    """
+    本地模拟的流式Chat Completions服务: SSE格式, HTTP/1.1 chunked编码
+    first_token_delay: 模拟prefill耗时; token_interval: 模拟逐Token解码间隔
+    """
+    def __init__(self, host="127.0.0.1", port=8766, first_token_delay=0.3, token_interval=0.02):
+        self.host = host
+        self.port = port
+        self.first_token_delay = first_token_delay
+        self.token_interval = token_interval
+        self.server = None
+        self.handlers = set()
+
+    async def start(self):
+        self.server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+
+    async def stop(self):
+        self.server.close()
+        # 客户端提前断开的连接在下一次写入时结束, 稍等这些处理协程退出
+        if self.handlers:
+            await asyncio.wait(self.handlers, timeout=1.0)
+        await self.server.wait_closed()
+
+    async def _handle_connection(self, reader, writer):
+        task = asyncio.current_task()
+        self.handlers.add(task)
+        try:
+            while True:
+                header = await reader.readuntil(b"\r\n\r\n")
+                length = 0
+                for line in header.decode("latin-1").split("\r\n")[1:]:
+                    if line.lower().startswith("content-length:"):
+                        length = int(line.split(":", 1)[1])
+                request = json.loads(await reader.readexactly(length) or b"{}")
+                writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\n"
+                             b"Transfer-Encoding: chunked\r\nConnection: keep-alive\r\n\r\n")
+                await self._stream_answer(writer, request)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self.handlers.discard(task)
+            writer.close()
+
+    async def _send_event(self, writer, payload):
+        data = f"data: {payload}\n\n".encode("utf-8")
+        writer.write(f"{len(data):x}\r\n".encode("latin-1") + data + b"\r\n")
+        await writer.drain()
+
+    async def _stream_answer(self, writer, request):
+        prompt = request.get("messages", [{}])[-1].get("content", "")
+        answer = f"MCP通过Slot将上下文按语义角色拆分，本次共收到{len(prompt)}字的上下文，模型可以按需组合。"
+        await asyncio.sleep(self.first_token_delay)
+        for i in range(0, len(answer), 2):
+            chunk = {"choices": [{"index": 0, "delta": {"content": answer[i:i + 2]}, "finish_reason": None}]}
+            await self._send_event(writer, json.dumps(chunk, ensure_ascii=False))
+            await asyncio.sleep(self.token_interval)
+        done = {"choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}
+        await self._send_event(writer, json.dumps(done))
+        await self._send_event(writer, "[DONE]")
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+class StreamingMCPClient:
+    """
+    在例2-5 MCPClient基础上增加stream_model, 并维护Slot历史与每次调用的流式指标
+    """
+    def __init__(self, base_url, api_key="", model="gpt-4-turbo", max_tokens=512, temperature=0.7, timeout=60.0):
+        self.http = httpx.AsyncClient(
+            base_url=base_url,
+            headers={"Authorization": f"Bearer {api_key}"} if api_key else {},
+            timeout=httpx.Timeout(timeout)
+        )
+        self.model = model
+        self.max_tokens = max_tokens
+        self.temperature = temperature
+        self.request_id = random.randint(1000, 9999)
+        self.history = []       # 已完成的问答, 以user/assistant Slot对进入后续轮次
+        self.call_metrics = []  # 每次调用的ttft/tokens_per_s等
+
+    def build_request(self, slots, tools=None, options=None):
+        request_message = {
+            "jsonrpc": "2.0",
+            "id": self.request_id,
+            "method": "mcp/invoke",
+            "params": {
+                "slots": self.history + slots,
+                "options": options or {"max_tokens": self.max_tokens, "temperature": self.temperature}
+            }
+        }
+        if tools:
+            request_message["params"]["tools"] = tools
+        return request_message
+
+    def compose_prompt(self, slots_list):
+        prompt_parts = []
+        for slot in slots_list:
+            role = slot.get("role", "")
+            name = slot.get("name", "")
+            content = slot.get("content", "")
+            if name:
+                prompt_parts.append(f"[{role} - {name}]: {content}")
+            else:
+                prompt_parts.append(f"[{role}]: {content}")
+        return "\n".join(prompt_parts)
+
+    async def stream_model(self, request_message):
+        """
+        异步生成器: 每收到一段增量内容即yield, 调用方无需等待完整回答
+        生成结束后拼装完整消息写入history并记录指标; 调用方可能提前break时须以
+        contextlib.aclosing包裹, 否则生成器要等事件循环回收时才关闭, HTTP流与记录都会被推迟
+        """
+        prompt = self.compose_prompt(request_message["params"]["slots"])
+        payload = {
+            "model": self.model,
+            "messages": [
+                {"role": "system", "content": "You are an AI assistant integrating MCP protocol."},
+                {"role": "user", "content": prompt}
+            ],
+            "max_tokens": self.max_tokens,
+            "temperature": self.temperature,
+            "stream": True
+        }
+        parts = []
+        chunks = 0
+        start = time.perf_counter()
+        first_token_at = None
+        finish_reason = None
+        try:
+            async with self.http.stream("POST", "/chat/completions", json=payload) as resp:
+                resp.raise_for_status()
+                async for line in resp.aiter_lines():
+                    if not line.startswith("data: "):
+                        continue
+                    data = line[len("data: "):]
+                    if data == "[DONE]":
+                        break
+                    choice = json.loads(data)["choices"][0]
+                    finish_reason = choice.get("finish_reason") or finish_reason
+                    delta = choice.get("delta", {}).get("content")
+                    if not delta:
+                        continue
+                    if first_token_at is None:
+                        first_token_at = time.perf_counter()
+                    parts.append(delta)
+                    chunks += 1
+                    yield delta
+        finally:
+            end = time.perf_counter()
+            # 每个流式chunk近似对应一个token
+            decode_time = end - first_token_at if first_token_at else 0.0
+            self.call_metrics.append({
+                "ttft_ms": round((first_token_at - start) * 1000, 1) if first_token_at else None,
+                "total_ms": round((end - start) * 1000, 1),
+                "tokens": chunks,
+                "tokens_per_s": round(chunks / decode_time, 1) if decode_time > 0 else None,
+                "finish_reason": finish_reason or "interrupted"
+            })
+            if parts:
+                # 本轮请求的user Slot与拼装出的assistant Slot成对写入, 后续轮次才能看到完整问答
+                slots = request_message["params"]["slots"]
+                if slots[:len(self.history)] == self.history:
+                    slots = slots[len(self.history):]
+                self.history.extend(slot for slot in slots if slot.get("role") == "user")
+                self.history.append({"role": "assistant", "content": "".join(parts)})
+
+    async def call_model(self, request_message):
+        """
+        非流式接口保持与例2-5相同的返回值, 内部复用流式通道
+        """
+        try:
+            return "".join([delta async for delta in self.stream_model(request_message)])
+        except Exception as e:
+            return f"Error calling model: {e!r}"
+
+    async def aclose(self):
+        await self.http.aclose()
+
+async def main():
+    server = LocalStreamingModelServer()
+    await server.start()
+    client = StreamingMCPClient(f"http://{server.host}:{server.port}",
+                                api_key=os.getenv("OPENAI_API_KEY", ""), max_tokens=256)
+    slots = [
+        {"role": "system", "content": "提供详细的技术说明，并结合实际案例。", "name": "Instruction"},
+        {"role": "user", "content": "请解释一下MCP协议如何提高大模型应用的灵活性。"}
+    ]
+    print("=== Streaming Model Response ===")
+    async with aclosing(client.stream_model(client.build_request(slots))) as stream:
+        async for delta in stream:
+            print(delta, end="", flush=True)
+    print()
+    print("调用指标:", client.call_metrics[-1])
+
+    # 第二轮: 上一轮的问题与完整回答已作为user/assistant Slot进入上下文
+    follow_up = [{"role": "user", "content": "能否举一个工具调用的例子？"}]
+    text = await client.call_model(client.build_request(follow_up))
+    print("第二轮回答:", text)
+    print("调用指标:", client.call_metrics[-1])
+    print("Slot历史条数:", len(client.history))
+
+    # 提前退出: aclosing在break后立即关闭生成器, 指标与部分回答当场写入
+    stop_early = [{"role": "user", "content": "简要说明即可。"}]
+    async with aclosing(client.stream_model(client.build_request(stop_early))) as stream:
+        received = 0
+        async for delta in stream:
+            received += 1
+            if received == 5:
+                break
+    print("提前退出指标:", client.call_metrics[-1], "Slot历史条数:", len(client.history))
+
+    await client.aclose()
+    await server.stop()
+
+if __name__ == "__main__":
+    asyncio.run(main())
+
+
+
+# 【例2-11】
+# 模型调用的精确匹配响应缓存: 规范化哈希键、TTL、LRU容量上限、可选磁盘层
+import json
+import time
+import random
+import hashlib
+import sqlite3
+from collections import OrderedDict
+
+class ResponseCache:
+    def __init__(self, max_entries=1024, ttl=600, disk_path=None):
+        """
+        :param max_entries: 内存层LRU容量
+        :param ttl: 缓存有效期(秒)
+        :param disk_path: 可选, SQLite文件路径; 内存层淘汰或进程重启后仍可命中
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.memory = OrderedDict()  # key -> (expire_at, response)
+        self.stats = {"hits": 0, "disk_hits": 0, "misses": 0, "bypass": 0, "evictions": 0}
+        self.db = None
+        if disk_path:
+            self.db = sqlite3.connect(disk_path)
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS response_cache "
+                "(key TEXT PRIMARY KEY, expire_at REAL, response TEXT)"
+            )
+            self.db.commit()
+
+    @staticmethod
+    def make_key(model, slots, options, tools=None):
+        """
+        规范化: 键排序、紧凑分隔符, 字段顺序不同但语义相同的请求得到相同哈希
+        """
+        canonical = json.dumps(
+            {"model": model, "slots": slots, "options": options, "tools": tools or []},
+            sort_keys=True, ensure_ascii=False, separators=(",", ":")
+        )
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        now = time.time()
+        entry = self.memory.get(key)
+        if entry is not None:
+            if entry[0] > now:
+                self.memory.move_to_end(key)
+                self.stats["hits"] += 1
+                return entry[1]
+            del self.memory[key]
+        if self.db is not None:
+            row = self.db.execute(
+                "SELECT expire_at, response FROM response_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row and row[0] > now:
+                response = json.loads(row[1])
+                self._put_memory(key, row[0], response)
+                self.stats["disk_hits"] += 1
+                return response
+        self.stats["misses"] += 1
+        return None
+
+    def _put_memory(self, key, expire_at, response):
+        self.memory[key] = (expire_at, response)
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.max_entries:
+            self.memory.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    def put(self, key, response):
+        expire_at = time.time() + self.ttl
+        self._put_memory(key, expire_at, response)
+        if self.db is not None:
+            self.db.execute(
+                "INSERT OR REPLACE INTO response_cache (key, expire_at, response) VALUES (?, ?, ?)",
+                (key, expire_at, json.dumps(response, ensure_ascii=False))
+            )
+            self.db.commit()
+
+    def purge_expired(self):
+        now = time.time()
+        for key in [k for k, (exp, _) in self.memory.items() if exp <= now]:
+            del self.memory[key]
+        if self.db is not None:
+            self.db.execute("DELETE FROM response_cache WHERE expire_at <= ?", (now,))
+            self.db.commit()
+
+def mock_model_infer(prompt):
+    """
+    模拟模型调用耗时; 真实场景替换为例2-5中的openai.ChatCompletion.create
+    """
+    time.sleep(0.2)
+    return f"[MockModel] 已基于{len(prompt)}字的上下文生成回答。"
+
+class CachedMCPClient:
+    def __init__(self, model="gpt-4-turbo", max_tokens=512, temperature=0.0, cache=None, backend=mock_model_infer):
+        self.model = model
+        self.max_tokens = max_tokens
+        self.temperature = temperature
+        self.request_id = random.randint(1000, 9999)
+        self.cache = cache or ResponseCache()
+        self.backend = backend
+
+    def build_request(self, slots, tools=None, options=None):
+        request_message = {
+            "jsonrpc": "2.0",
+            "id": self.request_id,
+            "method": "mcp/invoke",
+            "params": {
+                "slots": slots,
+                "options": options or {"max_tokens": self.max_tokens, "temperature": self.temperature}
+            }
+        }
+        if tools:
+            request_message["params"]["tools"] = tools
+        return request_message
+
+    def compose_prompt(self, slots_list):
+        prompt_parts = []
+        for slot in slots_list:
+            role = slot.get("role", "")
+            name = slot.get("name", "")
+            content = slot.get("content", "")
+            if name:
+                prompt_parts.append(f"[{role} - {name}]: {content}")
+            else:
+                prompt_parts.append(f"[{role}]: {content}")
+        return "\n".join(prompt_parts)
+
+    def call_model(self, request_message, bypass_cache=None):
+        """
+        :param bypass_cache: None时自动判断: temperature > 0 的采样结果不应复用
+        """
+        params = request_message["params"]
+        options = params.get("options", {})
+        if bypass_cache is None:
+            bypass_cache = options.get("temperature", self.temperature) > 0
+        if bypass_cache:
+            self.cache.stats["bypass"] += 1
+            return self.backend(self.compose_prompt(params["slots"]))
+
+        # 注意: 请求id不参与缓存键
+        key = ResponseCache.make_key(self.model, params["slots"], options, params.get("tools"))
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+        try:
+            response = self.backend(self.compose_prompt(params["slots"]))
+        except Exception as e:
+            # 错误结果不写入缓存
+            return f"Error calling model: {e}"
+        self.cache.put(key, response)
+        return response
+
+def example_usage():
+    cache = ResponseCache(max_entries=256, ttl=300, disk_path="mcp_response_cache.db")
+    client = CachedMCPClient(cache=cache)
+    system_slot = {"role": "system", "content": "你是一个严谨的翻译助手，保留术语原文。", "name": "TranslateInstruction"}
+    tool_slot = {"role": "tool", "content": "术语表：MCP=Model Context Protocol", "name": "Glossary"}
+    questions = ["MCP standardizes context injection.", "Slots separate semantic roles."]
+
+    # 模拟批处理任务: 同一批问题重复提交
+    start = time.perf_counter()
+    for _ in range(5):
+        for q in questions:
+            slots = [system_slot, tool_slot, {"role": "user", "content": f"请翻译：{q}"}]
+            client.call_model(client.build_request(slots, options={"max_tokens": 256, "temperature": 0}))
+    print(f"10次确定性调用耗时 {time.perf_counter() - start:.2f}s, 统计: {cache.stats}")
+
+    # 字段顺序不同不影响命中
+    reordered = [dict(reversed(list(s.items()))) for s in [system_slot, tool_slot]]
+    reordered.append({"content": f"请翻译：{questions[0]}", "role": "user"})
+    client.call_model(client.build_request(reordered, options={"temperature": 0, "max_tokens": 256}))
+    print("字段重排后统计:", cache.stats)
+
+    # temperature > 0 自动绕过缓存
+    slots = [system_slot, {"role": "user", "content": "请给出三种不同的译法。"}]
+    client.call_model(client.build_request(slots, options={"max_tokens": 256, "temperature": 0.8}))
+    print("采样请求后统计:", cache.stats)
+
+if __name__ == "__main__":
+    example_usage()
+
+
+
+# 【例2-12】
+# JSON-RPC批量请求: 单调递增id、一次写入多个请求、按id将响应分发回等待中的Future
+import json
+import time
+import random
+import asyncio
+import itertools
+from collections import deque
+
+# 单行消息上限, 批量请求可能远超StreamReader默认的64KB
+STREAM_LIMIT = 16 * 1024 * 1024
+
+class BatchMCPServer:
+    """
+    本地模拟的MCP服务端: 按行接收JSON-RPC消息, 支持单个请求与批量数组
+    """
+    def __init__(self, host="127.0.0.1", port=8767):
+        self.host = host
+        self.port = port
+        self.server = None
+        self.reads = 0
+
+    async def start(self):
+        self.server = await asyncio.start_server(self._handle_connection, self.host, self.port, limit=STREAM_LIMIT)
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def _handle_connection(self, reader, writer):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                self.reads += 1
+                message = json.loads(line)
+                if isinstance(message, list):
+                    if not message:
+                        reply = {"jsonrpc": "2.0", "error": {"code": -32600, "message": "Invalid Request: empty batch"}, "id": None}
+                    else:
+                        results = await asyncio.gather(*[self._handle_one(m) for m in message])
+                        # 通知(无id)不返回响应; 批量响应顺序不作保证
+                        reply = [r for r in results if r is not None]
+                        random.shuffle(reply)
+                else:
+                    reply = await self._handle_one(message)
+                if reply:
+                    writer.write(json.dumps(reply, ensure_ascii=False).encode("utf-8") + b"\n")
+                    await writer.drain()
+        finally:
+            writer.close()
+
+    async def _handle_one(self, request):
+        if "id" not in request:
+            return None
+        if request.get("method") != "mcp/invoke":
+            return {"jsonrpc": "2.0", "error": {"code": -32601, "message": "Method not found"}, "id": request["id"]}
+        slots = request.get("params", {}).get("slots", [])
+        await asyncio.sleep(random.uniform(0.01, 0.05))  # 模拟推理耗时
+        user_text = next((s["content"] for s in reversed(slots) if s.get("role") == "user"), "")
+        return {"jsonrpc": "2.0", "result": {"content": f"[MockModel] {user_text[:20]}"}, "id": request["id"]}
+
+class BatchMCPClient:
+    def __init__(self, host, port, max_tokens=512, temperature=0.7, max_batch_size=500, timeout=30.0):
+        """
+        :param timeout: 单次invoke/invoke_batch等待响应的默认上限(秒)
+        """
+        self.host = host
+        self.port = port
+        self.max_tokens = max_tokens
+        self.temperature = temperature
+        self.max_batch_size = max_batch_size
+        self.timeout = timeout
+        # 每次构造请求都分配新的id, 同一连接内单调递增且唯一
+        self._ids = itertools.count(1)
+        self.pending = {}  # id -> Future
+        self._writes = deque()  # 按发送顺序记录每次写入包含的id, 用于认领id为null的整批错误
+        self.reader = None
+        self.writer = None
+        self._reader_task = None
+        self.writes = 0
+
+    async def connect(self):
+        self.reader, self.writer = await asyncio.open_connection(self.host, self.port, limit=STREAM_LIMIT)
+        self._reader_task = asyncio.create_task(self._read_loop())
+
+    async def close(self):
+        self.writer.close()
+        await self.writer.wait_closed()
+        if self._reader_task:
+            await self._reader_task
+
+    def build_request(self, slots, tools=None, options=None):
+        request_message = {
+            "jsonrpc": "2.0",
+            "id": next(self._ids),
+            "method": "mcp/invoke",
+            "params": {
+                "slots": slots,
+                "options": options or {"max_tokens": self.max_tokens, "temperature": self.temperature}
+            }
+        }
+        if tools:
+            request_message["params"]["tools"] = tools
+        return request_message
+
+    async def _read_loop(self):
+        try:
+            while True:
+                line = await self.reader.readline()
+                if not line:
+                    break
+                message = json.loads(line)
+                for response in (message if isinstance(message, list) else [message]):
+                    if response.get("id") is None and "error" in response:
+                        self._fail_rejected_write(response)
+                        continue
+                    future = self.pending.pop(response.get("id"), None)
+                    if future is not None and not future.done():
+                        future.set_result(response)
+        finally:
+            # 连接断开: 所有未完成请求立即失败, 避免永久等待
+            for future in self.pending.values():
+                if not future.done():
+                    future.set_exception(ConnectionError("MCP连接已关闭"))
+            self.pending.clear()
+
+    def _fail_rejected_write(self, response):
+        """
+        服务端整体拒绝一条消息(如无法解析的批量)时以id为null回复错误;
+        按发送顺序找到最早一条尚无任何响应的写入, 把错误分发给其中每个请求
+        """
+        for ids in self._writes:
+            if all(i in self.pending for i in ids):
+                self._writes.remove(ids)
+                for i in ids:
+                    future = self.pending.pop(i)
+                    if not future.done():
+                        future.set_result({**response, "id": i})
+                return
+
+    def _register(self, request):
+        future = asyncio.get_running_loop().create_future()
+        self.pending[request["id"]] = future
+        return future
+
+    def _write(self, message, ids):
+        # 最早的写入已全部得到响应(或超时)时出队, 记录长度只与在途写入数有关
+        while self._writes and not any(i in self.pending for i in self._writes[0]):
+            self._writes.popleft()
+        self._writes.append(ids)
+        self.writer.write(json.dumps(message, ensure_ascii=False).encode("utf-8") + b"\n")
+        self.writes += 1
+
+    async def invoke(self, slots, tools=None, options=None, timeout=None):
+        request = self.build_request(slots, tools, options)
+        future = self._register(request)
+        try:
+            self._write(request, (request["id"],))
+            await self.writer.drain()
+            return await asyncio.wait_for(future, timeout or self.timeout)
+        finally:
+            self.pending.pop(request["id"], None)
+
+    async def invoke_batch(self, slot_lists, tools=None, options=None, timeout=None):
+        """
+        :param slot_lists: 多组slots, 每组对应一次mcp/invoke
+        :param timeout: 整批等待上限, 超时抛出asyncio.TimeoutError
+        :return: 与输入顺序一致的响应列表
+        """
+        requests = [self.build_request(slots, tools, options) for slots in slot_lists]
+        futures = [self._register(r) for r in requests]
+        try:
+            for i in range(0, len(requests), self.max_batch_size):
+                batch = requests[i:i + self.max_batch_size]
+                self._write(batch, tuple(r["id"] for r in batch))
+            await self.writer.drain()
+            return await asyncio.wait_for(asyncio.gather(*futures), timeout or self.timeout)
+        finally:
+            for r in requests:
+                self.pending.pop(r["id"], None)
+
+async def main():
+    server = BatchMCPServer()
+    await server.start()
+    client = BatchMCPClient(server.host, server.port)
+    await client.connect()
+
+    system_slot = {"role": "system", "content": "你是一个严谨的翻译助手，保留术语原文。"}
+    jobs = [[system_slot, {"role": "user", "content": f"第{i}条：MCP standardizes context injection."}]
+            for i in range(300)]
+
+    start = time.perf_counter()
+    for slots in jobs[:30]:
+        await client.invoke(slots)
+    single_cost = time.perf_counter() - start
+    print(f"逐个请求30次: {single_cost:.2f}s, 写入次数={client.writes}")
+
+    client.writes = 0
+    start = time.perf_counter()
+    responses = await client.invoke_batch(jobs)
+    batch_cost = time.perf_counter() - start
+    print(f"批量请求300次: {batch_cost:.2f}s, 写入次数={client.writes}")
+    # 服务端乱序返回, 客户端仍按提交顺序拿到对应结果
+    print("前3条响应:", [(r["id"], r["result"]["content"]) for r in responses[:3]])
+
+    await client.close()
+    await server.stop()
+
+if __name__ == "__main__":
+    asyncio.run(main())
+
+
+
+# 【例2-13】
+# 会话上下文存储: 落实例2-3中persistent/ephemeral生命周期, 跨会话驻留相同内容, 并统计每个会话的内存占用
+import sys
+import json
+
+class Slot:
+    def __init__(self, role, content, name=None, options=None):
+        self.role = role
+        self.content = content
+        self.name = name
+        self.options = options or {}
+
+    def to_dict(self):
+        slot_dict = {"role": self.role, "content": self.content}
+        if self.name:
+            slot_dict["name"] = self.name
+        if self.options:
+            slot_dict["options"] = self.options
+        return slot_dict
+
+class ContentPool:
+    """
+    内容驻留池: 相同文本在所有会话中只保存一份, 按引用计数回收
+    """
+    def __init__(self):
+        self.entries = {}  # text -> [canonical_text, refcount]
+
+    def acquire(self, text):
+        entry = self.entries.get(text)
+        if entry is None:
+            entry = self.entries[text] = [text, 0]
+        entry[1] += 1
+        return entry[0]
+
+    def release(self, text):
+        entry = self.entries.get(text)
+        if entry is None:
+            return
+        entry[1] -= 1
+        if entry[1] <= 0:
+            del self.entries[text]
+
+    def refcount(self, text):
+        entry = self.entries.get(text)
+        return entry[1] if entry else 0
+
+    def unique_bytes(self):
+        return sum(sys.getsizeof(text) for text in self.entries)
+
+class SessionContextStore:
+    def __init__(self, default_lifecycle="ephemeral"):
+        """
+        :param default_lifecycle: 未标注persistent/ephemeral的Slot按何种生命周期处理
+        """
+        self.pool = ContentPool()
+        self.default_lifecycle = default_lifecycle
+        # session_id -> {"persistent": {key: Slot}, "ephemeral": [Slot]}
+        self.sessions = {}
+
+    def _lifecycle(self, slot):
+        if slot.options.get("persistent"):
+            return "persistent"
+        if slot.options.get("ephemeral"):
+            return "ephemeral"
+        return self.default_lifecycle
+
+    def _intern(self, slot):
+        return Slot(slot.role, self.pool.acquire(slot.content), slot.name, slot.options)
+
+    def add_slots(self, session_id, slots):
+        session = self.sessions.setdefault(session_id, {"persistent": {}, "ephemeral": []})
+        for slot in slots:
+            interned = self._intern(slot)
+            if self._lifecycle(slot) == "persistent":
+                # 同角色同名的persistent Slot视为更新, 旧内容被替换而不是累积;
+                # 未命名的按(角色, 内容)去重, 调用方每轮重发时不会重复保存
+                if slot.name:
+                    key = (slot.role, slot.name)
+                else:
+                    key = (slot.role, None, interned.content)
+                old = session["persistent"].get(key)
+                if old is not None:
+                    self.pool.release(old.content)
+                session["persistent"][key] = interned
+            else:
+                session["ephemeral"].append(interned)
+
+    def next_turn(self, session_id, new_slots=()):
+        """
+        写入本轮新Slot, 返回本轮应发送的Slot列表; ephemeral Slot在返回后即被丢弃
+        """
+        self.add_slots(session_id, new_slots)
+        session = self.sessions[session_id]
+        turn_slots = list(session["persistent"].values()) + session["ephemeral"]
+        for slot in session["ephemeral"]:
+            self.pool.release(slot.content)
+        session["ephemeral"] = []
+        return turn_slots
+
+    def end_session(self, session_id):
+        session = self.sessions.pop(session_id, None)
+        if session is None:
+            return
+        for slot in list(session["persistent"].values()) + session["ephemeral"]:
+            self.pool.release(slot.content)
+
+    def memory_usage(self, session_id):
+        """
+        logical_bytes: 会话引用的全部内容大小
+        exclusive_bytes: 仅被该会话引用的内容大小(结束会话后可回收的部分)
+        """
+        session = self.sessions.get(session_id)
+        if session is None:
+            return {"slots": 0, "logical_bytes": 0, "exclusive_bytes": 0}
+        slots = list(session["persistent"].values()) + session["ephemeral"]
+        counts = {}
+        for slot in slots:
+            counts[slot.content] = counts.get(slot.content, 0) + 1
+        logical = sum(sys.getsizeof(slot.content) for slot in slots)
+        exclusive = sum(sys.getsizeof(text) for text, n in counts.items() if self.pool.refcount(text) == n)
+        return {"slots": len(slots), "logical_bytes": logical, "exclusive_bytes": exclusive}
+
+    def stats(self):
+        logical = sum(self.memory_usage(sid)["logical_bytes"] for sid in self.sessions)
+        return {"sessions": len(self.sessions), "unique_contents": len(self.pool.entries),
+                "unique_bytes": self.pool.unique_bytes(), "logical_bytes": logical}
+
+def example_usage():
+    store = SessionContextStore()
+    system_text = "你是AI绘画顾问，请结合工具结果推荐方案。" * 20
+    for i in range(100):
+        sid = f"session_{i}"
+        # 所有会话共享相同的system/memory文本, 只保存一份
+        store.add_slots(sid, [
+            Slot("system", system_text, name="Instruction", options={"persistent": True}),
+            Slot("memory", "用户上次查询：AI绘画工具使用说明。", name="LastQuery", options={"persistent": True})
+        ])
+
+    sid = "session_0"
+    for turn in range(3):
+        turn_slots = store.next_turn(sid, [
+            Slot("tool", f"调用结果：第{turn}轮检索到{turn + 3}条绘画插件推荐。", options={"ephemeral": True}),
+            Slot("user", f"第{turn}轮：继续推荐更多AI图像生成方案。")
+        ])
+        request = {
+            "jsonrpc": "2.0",
+            "id": 888 + turn,
+            "method": "mcp/invoke",
+            "params": {"slots": [s.to_dict() for s in turn_slots]}
+        }
+        print(f"=== Turn {turn}: 发送{len(turn_slots)}个Slot ===")
+        print(json.dumps([s["role"] for s in request["params"]["slots"]], ensure_ascii=False))
+        # 更新persistent memory: 同名Slot被替换, 数量不增长
+        store.add_slots(sid, [Slot("memory", f"用户第{turn}轮关注：AI图像生成方案。", name="LastQuery",
+                                   options={"persistent": True})])
+        print("会话内存:", store.memory_usage(sid))
+
+    print("全局统计:", store.stats())
+    for i in range(100):
+        store.end_session(f"session_{i}")
+    print("全部会话结束后:", store.stats())
+
+if __name__ == "__main__":
+    example_usage()
+
+
+
+# 【例2-14】
+# Slot增量编码: 协商delta模式后, 每轮只发送相对服务端基线的编辑操作(保留/删除/插入); 服务端状态丢失时回退全量
+import json
+import random
+import hashlib
+from difflib import SequenceMatcher
+
+# 服务端会话视图与客户端基线不一致
+DELTA_BASE_MISMATCH = -32010
+
+def slot_hash(slot):
+    canonical = json.dumps(slot, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha1(canonical.encode("utf-8")).hexdigest()[:16]
+
+def list_digest(hashes):
+    return hashlib.sha1(",".join(hashes).encode("ascii")).hexdigest()[:16]
+
+class DeltaMCPServer:
+    def __init__(self, supports_delta=True):
+        self.supports_delta = supports_delta
+        # session_id -> {"hashes": [...], "slots": [...], "by_hash": {hash: slot}, "digest": str}
+        self.sessions = {}
+
+    @staticmethod
+    def apply_edits(state, edits):
+        """
+        按顺序作用于基线Slot列表: {"keep": n}复制后续n条, {"remove": n}跳过后续n条,
+        {"insert": [...]}插入新Slot(字符串为基线中已有Slot的哈希); 编辑须恰好覆盖整个基线
+        """
+        base, slots, pos = state["slots"], [], 0
+        for edit in edits:
+            if "keep" in edit:
+                slots.extend(base[pos:pos + edit["keep"]])
+                pos += edit["keep"]
+            elif "remove" in edit:
+                pos += edit["remove"]
+            else:
+                slots.extend(state["by_hash"][s] if isinstance(s, str) else s for s in edit["insert"])
+        if pos != len(base):
+            raise KeyError("edits do not cover the base")
+        return slots
+
+    def handle_request(self, raw):
+        request = json.loads(raw)
+        method = request.get("method")
+        if method == "initialize":
+            client_caps = request.get("params", {}).get("capabilities", {})
+            caps = {"slot_delta": bool(client_caps.get("slot_delta")) and self.supports_delta}
+            return json.dumps({"jsonrpc": "2.0", "result": {"capabilities": caps}, "id": request["id"]})
+        if method != "mcp/invoke":
+            return json.dumps({"jsonrpc": "2.0", "error": {"code": -32601, "message": "Method not found"},
+                               "id": request.get("id")})
+
+        params = request.get("params", {})
+        session = params.get("session")
+        if "slot_edits" in params:
+            state = self.sessions.get(session["id"]) if session else None
+            try:
+                if state is None or state["digest"] != session.get("base_digest"):
+                    raise KeyError("unknown base")
+                slots = self.apply_edits(state, params["slot_edits"])
+            except KeyError:
+                return json.dumps({"jsonrpc": "2.0", "id": request["id"], "error": {
+                    "code": DELTA_BASE_MISMATCH, "message": "Delta base mismatch, full resend required"}})
+        else:
+            slots = params.get("slots", [])
+
+        result = {"content": f"[MockModel] 收到{len(slots)}个Slot, 最后一条: {slots[-1]['content'][:16] if slots else ''}"}
+        if session:
+            hashes = [slot_hash(s) for s in slots]
+            self.sessions[session["id"]] = {
+                "hashes": hashes,
+                "slots": slots,
+                "by_hash": dict(zip(hashes, slots)),
+                "digest": list_digest(hashes)
+            }
+            result["session_digest"] = self.sessions[session["id"]]["digest"]
+        return json.dumps({"jsonrpc": "2.0", "result": result, "id": request["id"]}, ensure_ascii=False)
+
+class DeltaMCPClient:
+    def __init__(self, server, max_tokens=512, temperature=0.7):
+        self.server = server
+        self.max_tokens = max_tokens
+        self.temperature = temperature
+        self.session_id = f"sess_{random.randint(1000, 9999)}"
+        self.request_id = 0
+        self.delta_enabled = False
+        self.server_view = None  # 服务端已确认的Slot哈希列表
+        self.stats = {"full": 0, "delta": 0, "fallback": 0, "bytes_sent": 0}
+
+    def _send(self, request):
+        raw = json.dumps(request, ensure_ascii=False)
+        self.stats["bytes_sent"] += len(raw.encode("utf-8"))
+        return json.loads(self.server.handle_request(raw))
+
+    def _next_id(self):
+        self.request_id += 1
+        return self.request_id
+
+    def initialize(self):
+        response = self._send({"jsonrpc": "2.0", "id": self._next_id(), "method": "initialize",
+                               "params": {"capabilities": {"slot_delta": True}}})
+        self.delta_enabled = response["result"]["capabilities"].get("slot_delta", False)
+        return self.delta_enabled
+
+    def build_request(self, slots, options=None, force_full=False):
+        params = {"options": options or {"max_tokens": self.max_tokens, "temperature": self.temperature}}
+        if self.delta_enabled:
+            params["session"] = {"id": self.session_id}
+        if self.delta_enabled and self.server_view is not None and not force_full:
+            params["slot_edits"] = self.diff_slots(self.server_view, slots)
+            params["session"]["base_digest"] = list_digest(self.server_view)
+        else:
+            params["slots"] = slots
+        return {"jsonrpc": "2.0", "id": self._next_id(), "method": "mcp/invoke", "params": params}
+
+    @staticmethod
+    def diff_slots(base_hashes, slots):
+        """
+        生成相对基线的编辑操作, 请求大小只与变化量有关; 插入的Slot若已在基线中(如重排)则只发送哈希
+        """
+        hashes = [slot_hash(s) for s in slots]
+        known = set(base_hashes)
+        edits = []
+        for tag, i1, i2, j1, j2 in SequenceMatcher(None, base_hashes, hashes, autojunk=False).get_opcodes():
+            if tag == "equal":
+                edits.append({"keep": i2 - i1})
+                continue
+            if i2 > i1:
+                edits.append({"remove": i2 - i1})
+            if j2 > j1:
+                edits.append({"insert": [h if h in known else s for s, h in zip(slots[j1:j2], hashes[j1:j2])]})
+        return edits
+
+    def invoke(self, slots, options=None):
+        request = self.build_request(slots, options)
+        is_delta = "slot_edits" in request["params"]
+        response = self._send(request)
+        if "error" in response and response["error"]["code"] == DELTA_BASE_MISMATCH:
+            # 服务端视图丢失(重启、淘汰等), 回退为全量发送并重建基线
+            self.stats["fallback"] += 1
+            is_delta = False
+            response = self._send(self.build_request(slots, options, force_full=True))
+        self.stats["delta" if is_delta else "full"] += 1
+        if "result" in response and self.delta_enabled:
+            self.server_view = [slot_hash(s) for s in slots]
+        return response
+
+def example_usage():
+    server = DeltaMCPServer()
+    system_slot = {"role": "system", "content": "提供详细的技术说明，并结合实际案例。" * 10, "name": "Instruction"}
+    memory_slot = {"role": "memory", "content": "MCP协议在上下文管理和语义注入方面具有创新意义。" * 10, "name": "MemoryNote"}
+
+    def run(client, turns=20, restart_at=None):
+        history = [system_slot, memory_slot]
+        for turn in range(turns):
+            if turn == restart_at:
+                server.sessions.clear()  # 模拟服务端重启
+            slots = history + [{"role": "user", "content": f"第{turn}轮问题：MCP如何控制上下文长度？"}]
+            client.invoke(slots)
+            history = slots + [{"role": "assistant", "content": f"第{turn}轮回答摘要"}]
+        return client.stats
+
+    full_client = DeltaMCPClient(DeltaMCPServer(supports_delta=False))
+    full_client.initialize()
+    print("全量模式:", run(full_client))
+
+    delta_client = DeltaMCPClient(server)
+    print("协商delta模式:", delta_client.initialize())
+    print("增量模式(第10轮服务端重启):", run(delta_client, restart_at=10))
+
+if __name__ == "__main__":
+    example_usage()
+
+
+
+# 【例2-15】
+# memory Slot滚动摘要: 超过Token阈值后在后台将旧memory压缩为一条摘要Slot, 不阻塞请求路径
+import re
+import json
+import random
+import asyncio
+import hashlib
+
+_TOKEN_PATTERN = re.compile(r"[\u4e00-\u9fff]|[A-Za-z0-9_]+|[^\sA-Za-z0-9_\u4e00-\u9fff]")
+
+def count_tokens(text):
+    return len(_TOKEN_PATTERN.findall(text))
+
+SUMMARY_PREFIX = "历史要点："
+
+class MockSummarizer:
+    """
+    本地模拟摘要器: 取每条记录的首个分句, 最多保留max_points条要点
+    真实场景可替换为调用大模型的摘要实现, 只需提供 async summarize(texts) -> str
+    """
+    def __init__(self, latency=0.3, max_points=6):
+        self.latency = latency
+        self.max_points = max_points
+        self.calls = 0
+
+    async def summarize(self, texts):
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        points = []
+        for text in texts:
+            if text.startswith(SUMMARY_PREFIX):
+                items = text[len(SUMMARY_PREFIX):].rstrip("。").split("；")
+            else:
+                items = [re.split(r"[，。；;,.]", text, maxsplit=1)[0].strip()]
+            for item in items:
+                if item and item not in points:
+                    points.append(item)
+        return SUMMARY_PREFIX + "；".join(points[-self.max_points:]) + "。"
+
+class MemoryCompactor:
+    def __init__(self, summarizer, threshold_tokens=200, keep_recent=3):
+        """
+        :param threshold_tokens: memory Slot总Token数超过该值时触发压缩
+        :param keep_recent: 最近的若干条memory保持原文, 不参与压缩
+        """
+        self.summarizer = summarizer
+        self.threshold_tokens = threshold_tokens
+        self.keep_recent = keep_recent
+        self.summary = None   # 当前摘要Slot
+        self.raw = []         # 尚未压缩的memory Slot
+        self._task = None
+        self._cache = {}      # 压缩输入哈希 -> 摘要文本
+        self.compactions = 0
+
+    def add_memory(self, slot):
+        self.raw.append(slot)
+        self._maybe_schedule()
+
+    def memory_tokens(self):
+        slots = ([self.summary] if self.summary else []) + self.raw
+        return sum(count_tokens(s["content"]) for s in slots)
+
+    def memory_slots(self):
+        """
+        请求路径调用: 直接返回当前摘要与未压缩的memory, 从不等待摘要生成
+        """
+        return ([self.summary] if self.summary else []) + list(self.raw)
+
+    def _maybe_schedule(self):
+        if self._task is not None and not self._task.done():
+            return
+        if len(self.raw) <= self.keep_recent or self.memory_tokens() <= self.threshold_tokens:
+            return
+        self._task = asyncio.get_running_loop().create_task(self._compact())
+
+    async def _compact(self):
+        old = self.raw[:len(self.raw) - self.keep_recent]
+        # 滚动摘要: 上一次的摘要与新压缩的旧memory一起作为输入
+        texts = ([self.summary["content"]] if self.summary else []) + [s["content"] for s in old]
+        key = hashlib.sha1("\x1f".join(texts).encode("utf-8")).hexdigest()
+        summary_text = self._cache.get(key)
+        if summary_text is None:
+            try:
+                summary_text = await self.summarizer.summarize(texts)
+            except Exception as e:
+                # 摘要失败不影响请求路径, 原始memory保持不变, 等待下一条memory到达时重试
+                print(f"[Compactor] 摘要失败, 保留原始memory: {e}")
+                return
+            self._cache = {key: summary_text}
+        # 压缩期间新增的memory保留在raw中, 只移除本次已纳入摘要的部分
+        self.raw = self.raw[len(old):]
+        self.summary = {"role": "memory", "name": "MemorySummary", "content": summary_text,
+                        "options": {"persistent": True}}
+        self.compactions += 1
+        # 本任务仍在运行, 需先清除引用, 否则_maybe_schedule会把它当作进行中的压缩而跳过
+        self._task = None
+        self._maybe_schedule()
+
+    async def flush(self):
+        # 压缩结束时可能接着调度下一轮, 等到没有进行中的任务为止
+        while self._task is not None and not self._task.done():
+            await self._task
+
+class MCPClient:
+    def __init__(self, model="gpt-4-turbo", max_tokens=512, temperature=0.7):
+        self.model = model
+        self.max_tokens = max_tokens
+        self.temperature = temperature
+        self.request_id = random.randint(1000, 9999)
+
+    def build_request(self, slots, tools=None, options=None):
+        request_message = {
+            "jsonrpc": "2.0",
+            "id": self.request_id,
+            "method": "mcp/invoke",
+            "params": {
+                "slots": slots,
+                "options": options or {"max_tokens": self.max_tokens, "temperature": self.temperature}
+            }
+        }
+        if tools:
+            request_message["params"]["tools"] = tools
+        return request_message
+
+async def main():
+    client = MCPClient()
+    summarizer = MockSummarizer(latency=0.3)
+    compactor = MemoryCompactor(summarizer, threshold_tokens=150, keep_recent=3)
+    system_slot = {"role": "system", "content": "提供详细的技术说明，并结合实际案例。", "name": "Instruction"}
+    topics = ["Slot语义角色", "上下文注入", "工具调用", "资源订阅", "版本协商", "能力协商"]
+
+    for turn in range(24):
+        topic = topics[turn % len(topics)]
+        compactor.add_memory({"role": "memory", "name": "MemoryNote",
+                              "content": f"第{turn}轮用户关注{topic}，希望结合实际案例说明，并对比传统Prompt拼接方式。"})
+        user_slot = {"role": "user", "content": f"第{turn}轮：继续讲解{topic}。"}
+        request = client.build_request([system_slot] + compactor.memory_slots() + [user_slot])
+        if turn % 4 == 3:
+            memory_count = sum(1 for s in request["params"]["slots"] if s["role"] == "memory")
+            print(f"Turn {turn}: memory Slot {memory_count}条, memory Token {compactor.memory_tokens()}, "
+                  f"已压缩{compactor.compactions}次")
+        await asyncio.sleep(0.1)  # 模拟一轮对话的间隔, 摘要在此期间于后台完成
+
+    await compactor.flush()
+    print("摘要器调用次数:", summarizer.calls)
+    print(json.dumps(compactor.memory_slots()[0], ensure_ascii=False, indent=2))
+
+if __name__ == "__main__":
+    asyncio.run(main())
\ No newline at end of file
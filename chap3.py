@@ -109,3 +109,1126 @@ async def update_resource(resource_id: str, new_content: str) -> str:
 # 运行服务器
 if __name__ == "__main__":
     mcp.run()
+
+
+
+
+# 【例3-6】
+# 由DataVersion演进的MVCC存储: 无锁快照读、CAS条件写、有界历史与垃圾回收、按版本增量遍历
+import bisect
+import threading
+from collections import deque
+
+_TOMBSTONE = object()
+
+class HistoryTruncated(Exception):
+    pass
+
+class Snapshot:
+    """
+    固定在某个版本上的只读视图, 跨多个key读取时结果一致
+    """
+    def __init__(self, store, version):
+        self.store = store
+        self.version = version
+
+    def get(self, key):
+        return self.store.get_data(key, at_version=self.version)
+
+    def release(self):
+        self.store._release_snapshot(self.version)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
+
+class MVCCStore:
+    def __init__(self, max_history=16, max_log=10000):
+        """
+        :param max_history: 每个key最多保留的历史版本数(活跃快照仍需要的版本不受此限制)
+        :param max_log: changes_since可追溯的变更记录条数
+        """
+        self.version = 0
+        self.max_history = max_history
+        # key -> ([version, ...], [value, ...]); 写入时整体替换元组, 读者拿到的始终是完整的旧列表或新列表
+        self.data = {}
+        self._log = deque(maxlen=max_log)  # (version, key)
+        self._write_lock = threading.Lock()
+        self._active = {}  # 快照版本 -> 引用数
+
+    # ---------- 读: 不加锁 ----------
+    def get_data(self, key, at_version=None):
+        """
+        与DataVersion.get_data兼容: 返回(value, version), 不存在时返回(None, 0)
+        """
+        entry = self.data.get(key)
+        if entry is None:
+            return (None, 0)
+        versions, values = entry
+        if at_version is None:
+            idx = len(versions) - 1
+        else:
+            idx = bisect.bisect_right(versions, at_version) - 1
+        if idx < 0 or values[idx] is _TOMBSTONE:
+            return (None, 0)
+        return (values[idx], versions[idx])
+
+    def snapshot(self):
+        with self._write_lock:
+            version = self.version
+            self._active[version] = self._active.get(version, 0) + 1
+        return Snapshot(self, version)
+
+    def _release_snapshot(self, version):
+        with self._write_lock:
+            self._active[version] -= 1
+            if not self._active[version]:
+                del self._active[version]
+
+    def changes_since(self, version):
+        """
+        按版本顺序遍历version之后的变更, 产出(version, key, value), value为None表示删除
+        """
+        log = list(self._log)
+        if log and version < log[0][0] - 1:
+            raise HistoryTruncated(f"版本{version}之后的变更已被回收, 需全量同步")
+        start = bisect.bisect_right([v for v, _ in log], version)
+        for v, key in log[start:]:
+            versions, values = self.data.get(key, ([], []))
+            idx = bisect.bisect_left(versions, v)
+            if idx == len(versions) or versions[idx] != v:
+                # 该版本已被有界历史或GC回收
+                raise HistoryTruncated(f"{key}@{v}已被回收, 需全量同步")
+            yield (v, key, None if values[idx] is _TOMBSTONE else values[idx])
+
+    # ---------- 写: 写者之间串行 ----------
+    def _commit(self, updates):
+        """
+        同一次提交中的所有key共享一个新版本号, 快照要么全部可见要么全部不可见
+        """
+        self.version += 1
+        oldest_needed = min(self._active) if self._active else self.version
+        for key, value in updates.items():
+            versions, values = self.data.get(key, ([], []))
+            versions = versions + [self.version]
+            values = values + [value]
+            # 有界历史: 超出上限时裁掉最旧版本, 但保留仍被活跃快照引用的版本
+            if len(versions) > self.max_history:
+                keep_from = len(versions) - self.max_history
+                needed = bisect.bisect_right(versions, oldest_needed) - 1
+                if needed >= 0:
+                    keep_from = min(keep_from, needed)
+                versions, values = versions[keep_from:], values[keep_from:]
+            self.data[key] = (versions, values)
+            self._log.append((self.version, key))
+        return self.version
+
+    def update_data(self, key, value):
+        with self._write_lock:
+            return self._commit({key: value})
+
+    def delete(self, key):
+        with self._write_lock:
+            return self._commit({key: _TOMBSTONE})
+
+    def compare_and_set_many(self, expected, updates):
+        """
+        多key条件写: expected中每个key的当前版本都匹配时(0表示key必须不存在), 原子提交updates
+        :return: (是否成功, 成功时为新版本, 失败时为{key: 当前版本})
+        """
+        with self._write_lock:
+            current = {key: self.get_data(key)[1] for key in expected}
+            if current != expected:
+                return (False, current)
+            return (True, self._commit(updates))
+
+    def compare_and_set(self, key, expected_version, value):
+        """
+        仅当key当前版本等于expected_version时写入(0表示key必须不存在)
+        :return: (是否成功, 当前版本)
+        """
+        ok, result = self.compare_and_set_many({key: expected_version}, {key: value})
+        return (ok, result if ok else result[key])
+
+    def gc(self):
+        """
+        回收所有活跃快照都不再可见的旧版本, 每个key保留最新的可见版本
+        """
+        with self._write_lock:
+            horizon = min(self._active) if self._active else self.version
+            removed = 0
+            for key, (versions, values) in list(self.data.items()):
+                idx = bisect.bisect_right(versions, horizon) - 1
+                if idx > 0:
+                    removed += idx
+                    versions, values = versions[idx:], values[idx:]
+                if len(versions) == 1 and values[0] is _TOMBSTONE and versions[0] <= horizon:
+                    del self.data[key]
+                    removed += 1
+                else:
+                    self.data[key] = (versions, values)
+            return removed
+
+def example_usage():
+    store = MVCCStore(max_history=8)
+    store.update_data("account:A", 100)
+    store.update_data("account:B", 100)
+
+    # 并发转账: 写者用多key CAS重试, 读者通过快照读取, 两账户总额在任意快照下都应为200
+    def transfer(times):
+        for _ in range(times):
+            while True:
+                a, va = store.get_data("account:A")
+                b, vb = store.get_data("account:B")
+                ok, _ = store.compare_and_set_many(
+                    {"account:A": va, "account:B": vb},
+                    {"account:A": a - 1, "account:B": b + 1}
+                )
+                if ok:
+                    break
+
+    inconsistent = []
+    def audit(times):
+        for _ in range(times):
+            with store.snapshot() as snap:
+                total = snap.get("account:A")[0] + snap.get("account:B")[0]
+                if total != 200:
+                    inconsistent.append((snap.version, total))
+
+    writers = [threading.Thread(target=transfer, args=(300,)) for _ in range(2)]
+    reader = threading.Thread(target=audit, args=(2000,))
+    for t in writers + [reader]:
+        t.start()
+    for t in writers + [reader]:
+        t.join()
+    print("最终余额:", store.get_data("account:A"), store.get_data("account:B"))
+    print("快照中总额不一致的次数:", len(inconsistent))
+
+    base = store.version
+    store.update_data("config:model", "gpt-4-turbo")
+    store.delete("account:B")
+    print("版本", base, "之后的变更:", list(store.changes_since(base)))
+    print("CAS冲突示例:", store.compare_and_set("config:model", 0, "gpt-4o"))
+    print("GC回收版本数:", store.gc())
+
+if __name__ == "__main__":
+    example_usage()
+
+
+
+# 【例3-7】
+# 按版本增量同步资源: 客户端携带已知版本, 服务端返回未修改、增量或全量
+import json
+import asyncio
+from collections import OrderedDict
+from difflib import SequenceMatcher
+
+from mcp.server.fastmcp import FastMCP
+
+# 沿用例3-3的DataVersion作为版本来源
+class DataVersion:
+    def __init__(self):
+        self.version = 0
+        self.data = {}
+
+    def update_data(self, key, value):
+        self.version += 1
+        self.data[key] = (value, self.version)
+
+    def get_data(self, key):
+        return self.data.get(key, (None, 0))
+
+class ResourceHistory(DataVersion):
+    """
+    在DataVersion基础上为每个资源保留最近若干版本, 用于计算增量
+    """
+    def __init__(self, max_history=8, max_diff_size=256 * 1024):
+        """
+        :param max_diff_size: 序列化后超过该大小的资源不计算增量, 直接全量返回
+        """
+        super().__init__()
+        self.max_history = max_history
+        self.max_diff_size = max_diff_size
+        self.history = {}  # key -> OrderedDict(version -> value)
+        self.deltas = {}   # key -> {base_version: 到当前版本的增量, 不划算时为None}
+
+    def update_data(self, key, value):
+        super().update_data(key, value)
+        versions = self.history.setdefault(key, OrderedDict())
+        versions[self.version] = value
+        while len(versions) > self.max_history:
+            versions.popitem(last=False)
+        # 已缓存的增量都以旧版本为目标, 整体替换而非原地清空, 计算中的线程写回旧字典不影响新版本
+        self.deltas[key] = {}
+
+    def get_version(self, key, version):
+        return self.history.get(key, {}).get(version)
+
+    def delta_since(self, key, since_version):
+        """
+        返回(当前版本, 增量); 基准版本已淘汰、资源过大或增量不小于全量时增量为None
+        每个(since_version, 当前版本)只计算一次
+        """
+        value, version = self.get_data(key)
+        cache = self.deltas.setdefault(key, {})
+        if since_version in cache:
+            return version, cache[since_version]
+        base = self.get_version(key, since_version)
+        delta = None
+        if base is not None:
+            full_size = _size(value)
+            if full_size <= self.max_diff_size:
+                delta = make_delta(base, value)
+                if delta is not None and _size(delta) >= full_size:
+                    delta = None
+        cache[since_version] = delta
+        return version, delta
+
+def make_delta(old, new):
+    """
+    dict资源按key生成补丁; 文本资源按行比较生成操作序列: [start, end]表示复用旧文本的行区间, 字符串表示新增内容
+    """
+    if isinstance(old, dict) and isinstance(new, dict):
+        return {
+            "type": "dict",
+            "set": {k: v for k, v in new.items() if k not in old or old[k] != v},
+            "unset": [k for k in old if k not in new]
+        }
+    if isinstance(old, str) and isinstance(new, str):
+        # 逐字符比较的开销随文档长度平方增长, 按行比较对大文档的小改动足够紧凑
+        old_lines, new_lines = old.splitlines(keepends=True), new.splitlines(keepends=True)
+        ops = []
+        for tag, i1, i2, j1, j2 in SequenceMatcher(None, old_lines, new_lines, autojunk=False).get_opcodes():
+            if tag == "equal":
+                ops.append([i1, i2])
+            elif tag in ("replace", "insert"):
+                ops.append("".join(new_lines[j1:j2]))
+        return {"type": "text", "ops": ops}
+    return None
+
+def apply_delta(old, delta):
+    if delta["type"] == "dict":
+        new = {k: v for k, v in old.items() if k not in delta["unset"]}
+        new.update(delta["set"])
+        return new
+    old_lines = old.splitlines(keepends=True)
+    parts = []
+    for op in delta["ops"]:
+        parts.append("".join(old_lines[op[0]:op[1]]) if isinstance(op, list) else op)
+    return "".join(parts)
+
+def _size(obj):
+    return len(json.dumps(obj, ensure_ascii=False, separators=(",", ":")))
+
+# 创建 MCP 服务器实例
+mcp = FastMCP("VersionedResourceServer")
+
+RESOURCES = ResourceHistory(max_history=8)
+RESOURCES.update_data("resource1", "初始内容")
+RESOURCES.update_data("exchange_rate", {"USD_CNY": 6.45, "EUR_CNY": 7.80})
+
+@mcp.resource("dynamic://{resource_id}")
+async def get_dynamic_resource(resource_id: str) -> str:
+    """根据资源 ID 返回对应的完整内容"""
+    value, _ = RESOURCES.get_data(resource_id)
+    if value is None:
+        return "资源未找到"
+    return value if isinstance(value, str) else json.dumps(value, ensure_ascii=False)
+
+@mcp.tool()
+async def read_resource_since(resource_id: str, since_version: int = 0) -> dict:
+    """
+    版本感知读取:
+      not_modified: 客户端版本即最新版本, 不返回内容
+      delta: 服务端仍保留客户端版本, 且增量小于全量
+      full: 其余情况返回完整内容
+    """
+    value, version = RESOURCES.get_data(resource_id)
+    if version == 0:
+        return {"status": "not_found", "resource_id": resource_id}
+    if since_version == version:
+        return {"status": "not_modified", "version": version}
+    if since_version:
+        # 差分计算放到线程中, 不阻塞事件循环; 结果缓存后同一基准版本的后续读取直接命中
+        version, delta = await asyncio.to_thread(RESOURCES.delta_since, resource_id, since_version)
+        if delta is not None:
+            return {"status": "delta", "base_version": since_version, "version": version, "delta": delta}
+        value, version = RESOURCES.get_data(resource_id)
+    return {"status": "full", "version": version, "content": value}
+
+@mcp.tool()
+async def update_resource(resource_id: str, new_content) -> str:
+    """更新指定资源的内容, 版本号由DataVersion统一递增"""
+    RESOURCES.update_data(resource_id, new_content)
+    return f"资源 {resource_id} 已更新为版本 {RESOURCES.version}。"
+
+class VersionedResourceClient:
+    """
+    例5-1 MCPClient.read_resource的版本感知版本: 本地缓存(版本, 内容), 只在变化时传输增量
+    """
+    def __init__(self, fetch):
+        self.fetch = fetch   # async (resource_id, since_version) -> dict
+        self.cache = {}      # resource_id -> (version, content)
+        self.bytes_received = 0
+        self.last_status = None
+
+    async def read_resource(self, resource_id):
+        version, content = self.cache.get(resource_id, (0, None))
+        reply = await self.fetch(resource_id, version)
+        self.bytes_received += _size(reply)
+        status = self.last_status = reply["status"]
+        if status == "not_modified":
+            return content
+        if status == "delta":
+            content = apply_delta(content, reply["delta"])
+        elif status == "full":
+            content = reply["content"]
+        else:
+            return None
+        self.cache[resource_id] = (reply["version"], content)
+        return content
+
+async def demo():
+    long_doc = "\n".join(f"第{i}节：MCP资源订阅与版本同步说明，内容保持稳定。" for i in range(200))
+    await update_resource("manual", long_doc)
+    client = VersionedResourceClient(read_resource_since)
+
+    async def read(resource_id):
+        before = client.bytes_received
+        content = await client.read_resource(resource_id)
+        print(f"读取 {resource_id}: {client.last_status}, 版本 {client.cache[resource_id][0]}, "
+              f"接收 {client.bytes_received - before} 字节")
+        return content
+
+    await read("manual")   # 首次读取: full
+    await read("manual")   # 未变化: not_modified
+    await update_resource("manual", long_doc.replace("第100节", "第100节(已修订)"))
+    updated = await read("manual")   # 小改动: delta
+    assert updated == RESOURCES.get_data("manual")[0]
+    print("全量文档大小:", _size(long_doc), "字节")
+
+    await read("exchange_rate")
+    await update_resource("exchange_rate", {"USD_CNY": 6.50, "EUR_CNY": 7.80})
+    print("汇率(小资源增量不划算, 直接全量):", await read("exchange_rate"))
+
+if __name__ == "__main__":
+    asyncio.run(demo())
+
+
+
+# 【例3-8】
+# 按URI订阅与合并通知: 只通知订阅了dynamic://{id}的客户端, 时间窗口内同一资源的多次更新合并为一条通知
+import time
+import asyncio
+
+from mcp.server.fastmcp import FastMCP
+
+class ResourceNotifier:
+    def __init__(self, window=0.2):
+        """
+        :param window: 合并窗口(秒), 资源首次变化后最多等待window秒发出一条通知; 0表示立即发送
+        """
+        self.window = window
+        self.subscribers = {}  # uri -> {subscriber_id: async send(uri, info)}
+        self._pending = {}     # uri -> {"version": 最新版本, "count": 窗口内更新次数}
+        self._timers = {}      # uri -> 待执行的flush任务
+        self.stats = {"updates": 0, "notifications": 0, "dropped_subscribers": 0}
+
+    def subscribe(self, uri, subscriber_id, send):
+        self.subscribers.setdefault(uri, {})[subscriber_id] = send
+
+    def unsubscribe(self, uri, subscriber_id):
+        subs = self.subscribers.get(uri)
+        if subs is not None:
+            subs.pop(subscriber_id, None)
+            if not subs:
+                del self.subscribers[uri]
+
+    def resource_changed(self, uri, version):
+        """
+        记录一次资源变化; 没有订阅者的资源直接忽略, 不产生任何通知
+        """
+        self.stats["updates"] += 1
+        if uri not in self.subscribers:
+            return
+        pending = self._pending.setdefault(uri, {"version": version, "count": 0})
+        pending["version"] = version
+        pending["count"] += 1
+        if uri not in self._timers:
+            self._timers[uri] = asyncio.get_running_loop().create_task(self._flush_later(uri))
+
+    async def _flush_later(self, uri):
+        if self.window > 0:
+            await asyncio.sleep(self.window)
+        self._timers.pop(uri, None)
+        pending = self._pending.pop(uri, None)
+        subs = self.subscribers.get(uri)
+        if pending is None or not subs:
+            return
+        info = {"version": pending["version"], "coalesced": pending["count"]}
+        items = list(subs.items())
+        results = await asyncio.gather(*[send(uri, info) for _, send in items], return_exceptions=True)
+        for (subscriber_id, _), result in zip(items, results):
+            if isinstance(result, Exception):
+                # 发送失败(连接已断开等)的订阅者被移除, 避免后续每次都重试
+                self.unsubscribe(uri, subscriber_id)
+                self.stats["dropped_subscribers"] += 1
+            else:
+                self.stats["notifications"] += 1
+
+    async def flush(self):
+        while self._timers:
+            await asyncio.gather(*list(self._timers.values()))
+
+# 创建 MCP 服务器实例
+mcp = FastMCP("DynamicResourceServer")
+
+dynamic_resources = {
+    "resource1": "初始内容"
+}
+resource_versions = {"resource1": 1}
+notifier = ResourceNotifier(window=0.2)
+
+@mcp.resource("dynamic://{resource_id}")
+async def get_dynamic_resource(resource_id: str) -> str:
+    """根据资源 ID 返回对应的内容"""
+    return dynamic_resources.get(resource_id, "资源未找到")
+
+# 订阅走协议标准的resources/subscribe与resources/unsubscribe请求, 注册在FastMCP底层的Server上,
+# 客户端直接调用session.subscribe_resource(uri)即可
+server = mcp._mcp_server
+
+@server.subscribe_resource()
+async def subscribe_resource(uri) -> None:
+    """订阅单个资源的变更通知"""
+    session = server.request_context.session
+
+    async def send(uri, info):
+        await session.send_resource_updated(uri)
+
+    notifier.subscribe(str(uri), id(session), send)
+
+@server.unsubscribe_resource()
+async def unsubscribe_resource(uri) -> None:
+    """取消订阅"""
+    notifier.unsubscribe(str(uri), id(server.request_context.session))
+
+@mcp.tool()
+async def update_resource(resource_id: str, new_content: str) -> str:
+    """更新指定资源的内容, 只通知该资源的订阅者, 且在合并窗口内只通知一次"""
+    if resource_id not in dynamic_resources:
+        return f"资源 {resource_id} 不存在。"
+    dynamic_resources[resource_id] = new_content
+    resource_versions[resource_id] += 1
+    notifier.resource_changed(f"dynamic://{resource_id}", resource_versions[resource_id])
+    return f"资源 {resource_id} 已更新。"
+
+async def demo():
+    for i in range(2, 6):
+        dynamic_resources[f"resource{i}"] = "初始内容"
+        resource_versions[f"resource{i}"] = 1
+
+    received = {}
+    def make_subscriber(name):
+        async def send(uri, info):
+            received.setdefault(name, []).append((uri, info))
+        return send
+
+    # 客户端A只关心resource1, 客户端B关心resource1和resource2, 其余资源无人订阅
+    notifier.subscribe("dynamic://resource1", "A", make_subscriber("A"))
+    notifier.subscribe("dynamic://resource1", "B", make_subscriber("B"))
+    notifier.subscribe("dynamic://resource2", "B", make_subscriber("B"))
+
+    async def broken(uri, info):
+        raise ConnectionResetError("client gone")
+    notifier.subscribe("dynamic://resource2", "C", broken)
+
+    start = time.perf_counter()
+    for burst in range(3):
+        for i in range(200):
+            await update_resource(f"resource{i % 5 + 1}", f"第{burst}批第{i}次更新")
+        await asyncio.sleep(0.3)
+    await notifier.flush()
+    elapsed = time.perf_counter() - start
+
+    for name, items in sorted(received.items()):
+        print(f"客户端{name}收到 {len(items)} 条通知:")
+        for uri, info in items:
+            print(f"  {uri} -> {info}")
+    print("统计:", notifier.stats, f"耗时 {elapsed:.2f}s")
+
+if __name__ == "__main__":
+    asyncio.run(demo())
+
+
+
+# 【例3-9】
+# 表驱动的请求分发: 方法注册表O(1)查找, 参数Schema在注册时预编译为校验函数, 错误统一为MCPError结构
+import time
+import asyncio
+
+class MCPError(Exception):
+    def __init__(self, code, message):
+        self.code = code
+        self.message = message
+
+    def to_dict(self):
+        return {"code": self.code, "message": self.message}
+
+INVALID_REQUEST = -32600
+METHOD_NOT_FOUND = -32601
+INVALID_PARAMS = -32602
+INTERNAL_ERROR = -32603
+
+_MISSING = object()
+
+def compile_params(schema):
+    """
+    将参数Schema编译为校验函数, 只在注册时执行一次
+    schema形如 {"uri": {"type": str, "required": True}, "context": {"type": dict, "default": dict}}
+    default为可调用对象时每次调用生成新值, 避免多个请求共享同一个可变默认值
+    """
+    fields = []
+    for name, spec in schema.items():
+        expected = spec.get("type", object)
+        if expected is float:
+            expected = (int, float)
+        # bool是int的子类, 数值参数不接受True/False
+        reject_bool = expected is int or expected == (int, float)
+        default = spec.get("default", _MISSING)
+        fields.append((name, expected, reject_bool, spec.get("required", False), default, callable(default)))
+    fields = tuple(fields)
+    known = frozenset(schema)
+
+    def validate(params):
+        if params is None:
+            params = {}
+        elif type(params) is not dict:
+            raise MCPError(INVALID_PARAMS, "Invalid params: params must be an object")
+        out = {}
+        for name, expected, reject_bool, required, default, is_factory in fields:
+            value = params.get(name, _MISSING)
+            if value is _MISSING:
+                if required:
+                    raise MCPError(INVALID_PARAMS, f"Invalid params: missing '{name}'")
+                if default is _MISSING:
+                    continue
+                value = default() if is_factory else default
+            elif not isinstance(value, expected) or (reject_bool and isinstance(value, bool)):
+                raise MCPError(INVALID_PARAMS, f"Invalid params: '{name}' has wrong type")
+            out[name] = value
+        if not known.issuperset(params):
+            unknown = sorted(set(params) - known)
+            raise MCPError(INVALID_PARAMS, f"Invalid params: unknown {unknown}")
+        return out
+
+    return validate
+
+class MethodRegistry:
+    def __init__(self):
+        self.methods = {}  # method -> (handler, validator)
+
+    def register(self, method, params=None):
+        validator = compile_params(params or {})
+        def decorator(func):
+            self.methods[method] = (func, validator)
+            return func
+        return decorator
+
+    def dispatch(self, request):
+        """
+        处理单个JSON-RPC请求, 返回响应字典; 所有错误都以error字段返回, 不向调用方抛出
+        通知(不带id)照常执行但返回None, 与例4-4一致; 格式无效的请求仍返回错误
+        """
+        response = self._dispatch(request)
+        if type(request) is dict and "id" not in request and type(request.get("method")) is str:
+            return None
+        return response
+
+    def _dispatch(self, request):
+        request_id = request.get("id") if type(request) is dict else None
+        try:
+            if type(request) is not dict or type(request.get("method")) is not str:
+                raise MCPError(INVALID_REQUEST, "Invalid Request: missing method")
+            entry = self.methods.get(request["method"])
+            if entry is None:
+                raise MCPError(METHOD_NOT_FOUND, f"Method not found: {request['method']}")
+            handler, validator = entry
+            result = handler(**validator(request.get("params")))
+            return {"jsonrpc": "2.0", "result": result, "id": request_id}
+        except MCPError as e:
+            return {"jsonrpc": "2.0", "error": e.to_dict(), "id": request_id}
+        except Exception as e:
+            return {"jsonrpc": "2.0", "error": {"code": INTERNAL_ERROR, "message": f"{type(e).__name__}: {e}"},
+                    "id": request_id}
+
+# ---------- 例3-2 与 例5-2 中的方法改写为注册表形式 ----------
+registry = MethodRegistry()
+
+@registry.register("ping")
+def ping():
+    return "pong"
+
+@registry.register("status")
+def status():
+    return {"status": "ok", "methods": len(registry.methods)}
+
+INVENTORY = {"iphone13": 25, "galaxyS22": 40, "macbookAir": 10}
+
+@registry.register("read_resource", {
+    "uri": {"type": str, "required": True},
+    "context": {"type": dict, "default": dict}
+})
+def read_resource(uri, context):
+    if "inventory" in uri and context.get("user_role", "guest") not in ("admin", "manager"):
+        raise PermissionError(f"用户角色 {context.get('user_role', 'guest')} 无权访问资源 inventory")
+    return dict(INVENTORY)
+
+@registry.register("call_tool", {
+    "tool_name": {"type": str, "required": True},
+    "tool_params": {"type": dict, "default": dict}
+})
+def call_tool(tool_name, tool_params):
+    tool = TOOLS.get(tool_name)
+    if tool is None:
+        raise MCPError(METHOD_NOT_FOUND, f"Tool not found: {tool_name}")
+    handler, validator = tool
+    return handler(**validator(tool_params))
+
+@registry.register("inject_context", {
+    "key": {"type": str, "required": True},
+    "value": {"type": object, "default": ""}
+})
+def inject_context(key, value):
+    return {"updated": True, "key": key, "value": value}
+
+# 工具同样使用注册表, 参数Schema在注册时编译
+TOOLS = {}
+
+def calculate_shipping(destination, weight_kg):
+    if destination == "domestic":
+        cost, eta_days = 10.0 + weight_kg * 2.0, 3
+    else:
+        cost, eta_days = 20.0 + weight_kg * 3.0, 10
+    return {"cost": round(cost, 2), "eta_days": eta_days, "destination": destination}
+
+TOOLS["shipping_calc"] = (calculate_shipping, compile_params({
+    "destination": {"type": str, "default": "domestic"},
+    "weight_kg": {"type": float, "default": 1.0}
+}))
+
+class MCPServer:
+    """
+    与例5-2接口一致的服务器, 内部改为表驱动分发
+    """
+    def __init__(self, registry):
+        self.registry = registry
+
+    async def handle_request(self, request):
+        return self.registry.dispatch(request)
+
+# ---------- 微基准: 分发开销随方法数量的变化 ----------
+def build_if_chain(n):
+    """
+    生成与注册表等价的if/elif分发函数(每个分支用.get()逐个取参数), 作为对照组
+    """
+    lines = ["def handle(request):",
+             "    method = request.get('method')",
+             "    params = request.get('params', {})"]
+    for i in range(n):
+        keyword = "if" if i == 0 else "elif"
+        lines.append(f"    {keyword} method == 'method_{i}':")
+        lines.append("        x = params.get('x')")
+        lines.append("        if not isinstance(x, int):")
+        lines.append("            return {'error': 'Invalid params'}")
+        lines.append("        return {'result': x}")
+    lines.append("    return {'error': 'Method not found'}")
+    namespace = {}
+    exec("\n".join(lines), namespace)
+    return namespace["handle"]
+
+def build_registry(n):
+    reg = MethodRegistry()
+    for i in range(n):
+        reg.register(f"method_{i}", {"x": {"type": int, "required": True}})(lambda x: x)
+    return reg
+
+def benchmark(method_counts=(10, 100, 1000), iterations=20000):
+    print(f"{'方法数':>6} {'if/elif(ns/req)':>16} {'注册表(ns/req)':>16}")
+    for n in method_counts:
+        # 取最后一个方法, 即if/elif链的最坏情况
+        request = {"jsonrpc": "2.0", "id": 1, "method": f"method_{n - 1}", "params": {"x": 42}}
+        chain, reg = build_if_chain(n), build_registry(n)
+        results = []
+        for handle in (chain, reg.dispatch):
+            start = time.perf_counter()
+            for _ in range(iterations):
+                handle(request)
+            results.append((time.perf_counter() - start) / iterations * 1e9)
+        print(f"{n:>6} {results[0]:>16.0f} {results[1]:>16.0f}")
+
+async def main():
+    server = MCPServer(registry)
+    requests = [
+        {"jsonrpc": "2.0", "id": 1, "method": "ping"},
+        {"jsonrpc": "2.0", "id": 2, "method": "read_resource",
+         "params": {"uri": "resource://inventory", "context": {"user_role": "manager"}}},
+        {"jsonrpc": "2.0", "id": 3, "method": "call_tool",
+         "params": {"tool_name": "shipping_calc", "tool_params": {"destination": "international", "weight_kg": 2.5}}},
+        {"jsonrpc": "2.0", "id": 4, "method": "call_tool",
+         "params": {"tool_name": "shipping_calc", "tool_params": {"weight_kg": "heavy"}}},
+        {"jsonrpc": "2.0", "id": 5, "method": "inject_context", "params": {"value": "zh-CN"}},
+        {"jsonrpc": "2.0", "id": 6, "method": "delete_everything"},
+        {"jsonrpc": "2.0", "id": 7},
+        {"jsonrpc": "2.0", "method": "ping"}  # 通知: 不返回响应
+    ]
+    for request in requests:
+        print(await server.handle_request(request))
+    benchmark()
+
+if __name__ == "__main__":
+    asyncio.run(main())
+
+
+
+# 【例3-10】
+# 预编译Prompt模板引擎: 模板编译一次为渲染函数, 编译期校验参数, 相同参数的渲染结果缓存; prompts/list与prompts/get直接使用编译后的注册表
+import json
+import time
+from functools import lru_cache
+from string import Formatter
+
+class MCPError(Exception):
+    def __init__(self, code, message):
+        self.code = code
+        self.message = message
+
+class PromptCompileError(Exception):
+    pass
+
+prompt_template = {
+    "name": "analyze_code",
+    "description": "Analyze code for potential improvements",
+    "arguments": [
+        {
+            "name": "language",
+            "description": "Programming language",
+            "required": True
+        },
+        {
+            "name": "code_snippet",
+            "description": "Code snippet to analyze",
+            "required": True
+        },
+        {
+            "name": "focus",
+            "description": "Optional review focus",
+            "required": False
+        }
+    ]
+}
+
+ANALYZE_CODE_TEXT = (
+    "请分析以下{language}代码，指出潜在的性能、可读性与安全问题，并给出改进建议。{focus}\n"
+    "```{language}\n{code_snippet}\n```"
+)
+
+class CompiledPrompt:
+    def __init__(self, definition, text, cache_size=256):
+        """
+        编译阶段完成: 解析占位符、校验占位符与参数声明一致、生成位置参数格式串
+        """
+        self.name = definition["name"]
+        self.definition = definition
+        self.arg_names = tuple(arg["name"] for arg in definition.get("arguments", []))
+        self.required = frozenset(arg["name"] for arg in definition.get("arguments", []) if arg.get("required"))
+        index = {name: i for i, name in enumerate(self.arg_names)}
+        used = set()
+        parts = []
+        for literal, field, spec, conversion in Formatter().parse(text):
+            parts.append(literal.replace("{", "{{").replace("}", "}}"))
+            if field is None:
+                continue
+            if spec or conversion:
+                raise PromptCompileError(f"{self.name}: 占位符{{{field}}}不支持格式说明或转换")
+            if field not in index:
+                raise PromptCompileError(f"{self.name}: 占位符{{{field}}}未在arguments中声明")
+            used.add(field)
+            parts.append("{%d}" % index[field])
+        missing = self.required - used
+        if missing:
+            raise PromptCompileError(f"{self.name}: 必填参数{sorted(missing)}未在模板中使用")
+        # 渲染时只需一次C实现的str.format调用
+        self._format = "".join(parts).format
+        self._render_cached = lru_cache(maxsize=cache_size)(self._format)
+
+    def render(self, arguments):
+        arguments = arguments or {}
+        missing = [name for name in self.required if not arguments.get(name)]
+        if missing:
+            raise MCPError(-32602, f"Missing required arguments for prompt {self.name}: {sorted(missing)}")
+        values = tuple(str(arguments.get(name, "")) for name in self.arg_names)
+        return self._render_cached(*values)
+
+class PromptRegistry:
+    def __init__(self):
+        self.prompts = {}
+        self._list_cache = None
+
+    def register(self, definition, text):
+        compiled = CompiledPrompt(definition, text)
+        self.prompts[compiled.name] = compiled
+        self._list_cache = None
+        return compiled
+
+    def list_prompts(self):
+        if self._list_cache is None:
+            self._list_cache = {"prompts": [p.definition for p in self.prompts.values()]}
+        return self._list_cache
+
+    def get_prompt(self, name, arguments=None):
+        compiled = self.prompts.get(name)
+        if compiled is None:
+            raise MCPError(-32602, f"Unknown prompt: {name}")
+        return {
+            "description": compiled.definition.get("description", ""),
+            "messages": [{"role": "user", "content": {"type": "text", "text": compiled.render(arguments)}}]
+        }
+
+    def handle_request(self, request):
+        try:
+            params = request.get("params", {})
+            if request.get("method") == "prompts/list":
+                result = self.list_prompts()
+            elif request.get("method") == "prompts/get":
+                result = self.get_prompt(params.get("name"), params.get("arguments"))
+            else:
+                raise MCPError(-32601, "Method not found")
+            return {"jsonrpc": "2.0", "result": result, "id": request.get("id")}
+        except MCPError as e:
+            return {"jsonrpc": "2.0", "error": {"code": e.code, "message": e.message}, "id": request.get("id")}
+
+def example_usage():
+    registry = PromptRegistry()
+    registry.register(prompt_template, ANALYZE_CODE_TEXT)
+
+    # 编译期错误: 模板引用了未声明的参数
+    try:
+        registry.register({"name": "broken", "arguments": [{"name": "topic", "required": True}]},
+                          "请总结{topic}，输出语言为{lang}")
+    except PromptCompileError as e:
+        print("编译失败:", e)
+
+    print(json.dumps(registry.handle_request({"jsonrpc": "2.0", "id": 1, "method": "prompts/list"}),
+                     ensure_ascii=False)[:120], "...")
+    response = registry.handle_request({"jsonrpc": "2.0", "id": 2, "method": "prompts/get", "params": {
+        "name": "analyze_code",
+        "arguments": {"language": "python", "code_snippet": "for i in range(len(a)):\n    print(a[i])"}
+    }})
+    print(response["result"]["messages"][0]["content"]["text"])
+    print(registry.handle_request({"jsonrpc": "2.0", "id": 3, "method": "prompts/get",
+                                   "params": {"name": "analyze_code", "arguments": {"language": "go"}}}))
+
+    # 对比: 每次临时拼接字符串 vs 预编译+缓存
+    args = {"language": "python", "code_snippet": "print('hello')" * 20, "focus": "重点关注性能。"}
+    n = 100000
+    start = time.perf_counter()
+    for _ in range(n):
+        ANALYZE_CODE_TEXT.format(**{"focus": "", **args})
+    adhoc = time.perf_counter() - start
+    compiled = registry.prompts["analyze_code"]
+    start = time.perf_counter()
+    for _ in range(n):
+        compiled.render(args)
+    cached = time.perf_counter() - start
+    print(f"临时format: {adhoc / n * 1e9:.0f} ns/次, 预编译+缓存: {cached / n * 1e9:.0f} ns/次, "
+          f"缓存命中: {compiled._render_cached.cache_info().hits}")
+
+if __name__ == "__main__":
+    example_usage()
+
+
+
+# 【例3-11】
+# list_resources游标分页: 按URI稳定排序, 页大小可配置, 序列化后的分页结果缓存, 资源集合变化时失效
+import json
+import time
+import base64
+import bisect
+import asyncio
+from collections import OrderedDict
+import mcp.types as types
+from mcp.server import Server
+from mcp.server.stdio import stdio_server
+from mcp.shared.exceptions import McpError
+
+class MCPError(Exception):
+    def __init__(self, code, message):
+        self.code = code
+        self.message = message
+
+def encode_cursor(after_uri):
+    return base64.urlsafe_b64encode(after_uri.encode("utf-8")).decode("ascii")
+
+def decode_cursor(cursor):
+    try:
+        after_uri = base64.b64decode(cursor.encode("ascii"), altchars=b"-_", validate=True).decode("utf-8")
+    except Exception:
+        after_uri = ""
+    if not after_uri:
+        raise MCPError(-32602, "Invalid cursor")
+    return after_uri
+
+class ResourceCatalog:
+    def __init__(self, page_size=100, max_page_size=1000, max_cached_pages=256):
+        """
+        游标记录上一页最后一个URI(键集分页), 翻页期间有资源增删时已返回的资源不会重复或遗漏
+        :param max_cached_pages: 两类页缓存各自保留的最大页数; 游标由客户端提供, 不设上限会被任意游标撑大
+        """
+        self.page_size = page_size
+        self.max_page_size = max_page_size
+        self.max_cached_pages = max_cached_pages
+        self.resources = {}  # uri -> {"uri", "name", ...}
+        self.uris = []       # 按URI排序, 保证分页顺序稳定
+        self.generation = 0
+        self._pages = OrderedDict()      # (after_uri, page_size) -> (序列化的result字节, 本页资源), LRU
+        self._converted = OrderedDict()  # (after_uri, page_size, converter) -> converter(本页资源), LRU
+        self.stats = {"hits": 0, "misses": 0}
+
+    def _changed(self):
+        self.generation += 1
+        self._pages.clear()
+        self._converted.clear()
+
+    def add(self, uri, name, **extra):
+        if uri not in self.resources:
+            bisect.insort(self.uris, uri)
+        self.resources[uri] = {"uri": uri, "name": name, **extra}
+        self._changed()
+
+    def remove(self, uri):
+        if self.resources.pop(uri, None) is not None:
+            del self.uris[bisect.bisect_left(self.uris, uri)]
+            self._changed()
+
+    def _cache_get(self, cache, key):
+        value = cache.get(key)
+        if value is not None:
+            cache.move_to_end(key)
+        return value
+
+    def _cache_put(self, cache, key, value):
+        cache[key] = value
+        if len(cache) > self.max_cached_pages:
+            cache.popitem(last=False)
+
+    def _key(self, cursor, page_size):
+        page_size = min(page_size or self.page_size, self.max_page_size)
+        return (decode_cursor(cursor) if cursor else None, page_size)
+
+    def _page(self, cursor, page_size):
+        key = after, page_size = self._key(cursor, page_size)
+        cached = self._cache_get(self._pages, key)
+        if cached is not None:
+            self.stats["hits"] += 1
+            return cached
+        self.stats["misses"] += 1
+        start = bisect.bisect_right(self.uris, after) if after is not None else 0
+        uris = self.uris[start:start + page_size]
+        result = {"resources": [self.resources[uri] for uri in uris]}
+        if start + page_size < len(self.uris):
+            result["nextCursor"] = encode_cursor(uris[-1])
+        cached = (json.dumps(result, ensure_ascii=False, separators=(",", ":")).encode("utf-8"), result)
+        self._cache_put(self._pages, key, cached)
+        return cached
+
+    def list_page(self, cursor=None, page_size=None):
+        return self._page(cursor, page_size)[1]
+
+    def list_page_bytes(self, cursor=None, page_size=None):
+        """
+        供自定义传输层直接写出的序列化结果, 命中缓存时无需重新序列化
+        """
+        return self._page(cursor, page_size)[0]
+
+    def list_page_as(self, converter, cursor=None, page_size=None):
+        """
+        按页缓存converter(本页资源)的返回值(如SDK的ListResourcesResult对象), 与序列化结果一同失效
+        """
+        key = self._key(cursor, page_size) + (converter,)
+        cached = self._cache_get(self._converted, key)
+        if cached is None:
+            cached = converter(self._page(cursor, page_size)[1])
+            self._cache_put(self._converted, key, cached)
+        else:
+            self.stats["hits"] += 1
+        return cached
+
+# ---------- 接入MCP Server: 覆盖resources/list处理函数以支持cursor ----------
+app = Server("example-server")
+catalog = ResourceCatalog(page_size=100)
+catalog.add("example://resource", "示例资源")
+
+def to_list_resources_result(page):
+    return types.ListResourcesResult(
+        resources=[types.Resource(**r) for r in page["resources"]],
+        nextCursor=page.get("nextCursor")
+    )
+
+async def handle_list_resources(req: types.ListResourcesRequest):
+    cursor = req.params.cursor if req.params else None
+    try:
+        # 缓存的是SDK结果对象, 命中时不再逐条构造types.Resource
+        result = catalog.list_page_as(to_list_resources_result, cursor)
+    except MCPError as e:
+        # 低层Server把McpError原样转成JSON-RPC错误, 其他异常一律变为code 0
+        raise McpError(types.ErrorData(code=e.code, message=e.message))
+    return types.ServerResult(result)
+
+app.request_handlers[types.ListResourcesRequest] = handle_list_resources
+
+async def main():
+    async with stdio_server() as streams:
+        await app.run(streams[0], streams[1], app.create_initialization_options())
+
+def example_usage():
+    big = ResourceCatalog(page_size=500)
+    for i in range(20000):
+        big.add(f"doc://kb/{i:05d}", f"知识库文档{i}", mimeType="text/markdown")
+
+    def list_all(catalog):
+        resources, cursor, pages, size = [], None, 0, 0
+        while True:
+            raw = catalog.list_page_bytes(cursor)
+            page = json.loads(raw)
+            size += len(raw)
+            pages += 1
+            resources.extend(page["resources"])
+            cursor = page.get("nextCursor")
+            if cursor is None:
+                return resources, pages, size
+
+    start = time.perf_counter()
+    resources, pages, size = list_all(big)
+    cold = time.perf_counter() - start
+    start = time.perf_counter()
+    list_all(big)
+    warm = time.perf_counter() - start
+    print(f"共{len(resources)}个资源, {pages}页, 合计{size / 1024:.0f}KB, 单页约{size / pages / 1024:.1f}KB")
+    print(f"首次遍历 {cold * 1000:.1f}ms, 缓存命中遍历 {warm * 1000:.1f}ms, 统计: {big.stats}")
+
+    # 翻页过程中资源集合发生变化: 缓存失效, 游标仍然有效且不会重复返回
+    first = big.list_page()
+    big.add("doc://kb/00000a", "新插入文档")
+    big.remove("doc://kb/00600")
+    second = big.list_page(first["nextCursor"])
+    print("第二页首个资源:", second["resources"][0]["uri"], "generation:", big.generation)
+    try:
+        big.list_page("%%%")
+    except MCPError as e:
+        print("非法游标:", e.code, e.message)
+
+if __name__ == "__main__":
+    example_usage()
\ No newline at end of file
@@ -238,4 +238,1508 @@ async def main():
     await server.wait_closed()
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    asyncio.run(main())
+
+
+
+# 【例4-4】
+# 增量分帧解析: 支持换行分隔与长度前缀两种模式, 处理半包与粘包, 不重复扫描缓冲区, 并限制单连接内存
+import asyncio
+import json
+import struct
+
+SERVER_SUPPORTED_VERSIONS = ["1.0.0", "1.1.0", "2.0.0"]
+SERVER_CAPABILITIES = {"prompts": True, "resources": True, "tools": True, "logging": True, "experimental": False}
+
+class FrameTooLarge(Exception):
+    pass
+
+class NewlineFramer:
+    """
+    换行分隔的JSON消息(JSON序列化结果中不含裸换行符)
+    """
+    def __init__(self, max_frame=1024 * 1024):
+        self.max_frame = max_frame
+        self.buffer = bytearray()
+        self._scanned = 0  # 缓冲区中已确认不含换行符的长度, 下次从这里继续查找
+
+    def encode(self, payload):
+        return payload + b"\n"
+
+    def feed(self, data):
+        self.buffer += data
+        frames = []
+        start = 0
+        while True:
+            end = self.buffer.find(b"\n", max(start, self._scanned))
+            if end < 0:
+                break
+            if end - start > self.max_frame:
+                raise FrameTooLarge(f"消息长度超过上限{self.max_frame}字节")
+            frames.append(bytes(self.buffer[start:end]))
+            start = end + 1
+            self._scanned = start
+        # 每次feed只整体移动一次缓冲区, 已消费部分的丢弃开销与数据量成线性关系
+        if start:
+            del self.buffer[:start]
+        self._scanned = len(self.buffer)
+        if len(self.buffer) > self.max_frame:
+            raise FrameTooLarge(f"未完成的消息已超过上限{self.max_frame}字节")
+        return frames
+
+class LengthPrefixFramer:
+    """
+    4字节大端长度前缀 + 消息体
+    """
+    HEADER = struct.Struct("!I")
+
+    def __init__(self, max_frame=1024 * 1024):
+        self.max_frame = max_frame
+        self.buffer = bytearray()
+
+    def encode(self, payload):
+        return self.HEADER.pack(len(payload)) + payload
+
+    def feed(self, data):
+        self.buffer += data
+        frames = []
+        pos = 0
+        size = self.HEADER.size
+        while len(self.buffer) - pos >= size:
+            (length,) = self.HEADER.unpack_from(self.buffer, pos)
+            # 读到长度字段即可判断是否超限, 不必等待消息体到达
+            if length > self.max_frame:
+                raise FrameTooLarge(f"声明的消息长度{length}超过上限{self.max_frame}字节")
+            if len(self.buffer) - pos - size < length:
+                break
+            frames.append(bytes(self.buffer[pos + size:pos + size + length]))
+            pos += size + length
+        if pos:
+            del self.buffer[:pos]
+        return frames
+
+FRAMERS = {"newline": NewlineFramer, "length": LengthPrefixFramer}
+
+class MCPServerProtocol(asyncio.Protocol):
+    def __init__(self, framing="newline", max_frame=1024 * 1024):
+        self.framer = FRAMERS[framing](max_frame)
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.peername = transport.get_extra_info('peername')
+
+    def data_received(self, data):
+        try:
+            frames = self.framer.feed(data)
+        except FrameTooLarge as e:
+            # 超限后流中的边界已不可信, 回复错误后关闭连接
+            self.send({"jsonrpc": "2.0", "error": {"code": -32600, "message": str(e)}, "id": None})
+            self.transport.close()
+            return
+        for frame in frames:
+            try:
+                request = json.loads(frame)
+            except (json.JSONDecodeError, UnicodeDecodeError):
+                self.send_error(None, -32700, "无效的JSON格式")
+                continue
+            if isinstance(request, list):
+                # JSON-RPC批量请求: 逐条处理, 响应合并为一个数组返回(通知不产生响应)
+                if not request:
+                    self.send_error(None, -32600, "批量请求不能为空")
+                    continue
+                responses = [r for r in map(self.handle_request, request) if r is not None]
+                if responses:
+                    self.send(responses)
+            else:
+                response = self.handle_request(request)
+                if response is not None:
+                    self.send(response)
+
+    def handle_request(self, request):
+        """
+        处理单个请求并返回响应字典; 通知(不带id)返回None
+        """
+        if not isinstance(request, dict) or not isinstance(request.get("method"), str):
+            return self.error_response(None, -32600, "无效的请求")
+        response = self.dispatch(request.get("id"), request["method"], request.get("params", {}))
+        return response if "id" in request else None
+
+    def dispatch(self, request_id, method, params):
+        if not isinstance(params, dict):
+            return self.error_response(request_id, -32602, "params必须是对象")
+        if method == "negotiate_version":
+            versions = params.get("versions", [])
+            if not isinstance(versions, list):
+                return self.error_response(request_id, -32602, "versions必须是数组")
+            version = next((v for v in versions if v in SERVER_SUPPORTED_VERSIONS), None)
+            if version is None:
+                response = self.error_response(request_id, -32000, "没有兼容的协议版本")
+            else:
+                response = {"jsonrpc": "2.0", "result": {"version": version}, "id": request_id}
+        elif method == "initialize":
+            capabilities = params.get("capabilities", {})
+            if not isinstance(capabilities, dict):
+                return self.error_response(request_id, -32602, "capabilities必须是对象")
+            caps = {k: bool(v and SERVER_CAPABILITIES.get(k, False)) for k, v in capabilities.items()}
+            response = {"jsonrpc": "2.0", "result": {"capabilities": caps}, "id": request_id}
+        elif method == "echo":
+            response = {"jsonrpc": "2.0", "result": params, "id": request_id}
+        else:
+            response = self.error_response(request_id, -32601, "未知的方法")
+        return response
+
+    def error_response(self, request_id, code, message):
+        return {"jsonrpc": "2.0", "error": {"code": code, "message": message}, "id": request_id}
+
+    def send(self, response):
+        self.transport.write(self.framer.encode(json.dumps(response).encode()))
+
+    def send_error(self, request_id, code, message):
+        self.send(self.error_response(request_id, code, message))
+
+class FramedConnection:
+    """
+    客户端分帧读写: 不再依赖一次read(1024)恰好读到一条完整消息
+    """
+    def __init__(self, reader, writer, framing="newline", max_frame=1024 * 1024):
+        self.reader = reader
+        self.writer = writer
+        self.framing = framing
+        self.max_frame = max_frame
+
+    @classmethod
+    async def open(cls, host, port, framing="newline", max_frame=1024 * 1024):
+        # StreamReader的limit同时约束readuntil能缓存的最大长度
+        reader, writer = await asyncio.open_connection(host, port, limit=max_frame + 1)
+        return cls(reader, writer, framing, max_frame)
+
+    async def send(self, message):
+        payload = json.dumps(message).encode()
+        if self.framing == "newline":
+            self.writer.write(payload + b"\n")
+        else:
+            self.writer.write(LengthPrefixFramer.HEADER.pack(len(payload)) + payload)
+        await self.writer.drain()
+
+    async def receive(self):
+        if self.framing == "newline":
+            try:
+                line = await self.reader.readuntil(b"\n")
+            except asyncio.LimitOverrunError:
+                raise FrameTooLarge(f"响应长度超过上限{self.max_frame}字节")
+            return json.loads(line)
+        header = await self.reader.readexactly(LengthPrefixFramer.HEADER.size)
+        (length,) = LengthPrefixFramer.HEADER.unpack(header)
+        if length > self.max_frame:
+            raise FrameTooLarge(f"响应长度{length}超过上限{self.max_frame}字节")
+        return json.loads(await self.reader.readexactly(length))
+
+    async def close(self):
+        self.writer.close()
+        await self.writer.wait_closed()
+
+async def main():
+    # 1. 解析器单独验证: 逐字节喂入(半包)与多条消息合并喂入(粘包)结果一致
+    for framing, framer_cls in FRAMERS.items():
+        messages = [json.dumps({"id": i, "data": "x" * (i * 37)}).encode() for i in range(50)]
+        stream = b"".join(framer_cls().encode(m) for m in messages)
+        byte_by_byte = framer_cls()
+        frames = [f for i in range(len(stream)) for f in byte_by_byte.feed(stream[i:i + 1])]
+        assert frames == messages and framer_cls().feed(stream) == messages
+        print(f"{framing}: 逐字节与整块解析均得到{len(frames)}条消息")
+
+    # 2. 端到端: 合并发送的多条请求、1MB的大消息、超限消息
+    loop = asyncio.get_running_loop()
+    for framing in FRAMERS:
+        server = await loop.create_server(lambda: MCPServerProtocol(framing, max_frame=2 * 1024 * 1024),
+                                          '127.0.0.1', 8888)
+        conn = await FramedConnection.open('127.0.0.1', 8888, framing, max_frame=2 * 1024 * 1024)
+        requests = [
+            {"jsonrpc": "2.0", "method": "negotiate_version", "params": {"versions": ["1.1.0", "2.0.0"]}, "id": 1},
+            {"jsonrpc": "2.0", "method": "initialize", "params": {"capabilities": {"tools": True}}, "id": 2},
+            {"jsonrpc": "2.0", "method": "echo", "params": {"blob": "y" * (1024 * 1024)}, "id": 3}
+        ]
+        payload = b"".join(MCPServerProtocol(framing).framer.encode(json.dumps(r).encode()) for r in requests)
+        conn.writer.write(payload)  # 一次写出三条消息
+        await conn.writer.drain()
+        for _ in requests:
+            response = await conn.receive()
+            result = response.get("result")
+            print(f"[{framing}] id={response['id']}",
+                  f"echo {len(result['blob'])} 字节" if "blob" in result else result)
+        await conn.send({"jsonrpc": "2.0", "method": "echo", "params": {"blob": "z" * (3 * 1024 * 1024)}, "id": 4})
+        print(f"[{framing}] 超限消息:", (await conn.receive())["error"]["message"])
+        await conn.close()
+        server.close()
+        await server.wait_closed()
+
+if __name__ == "__main__":
+    asyncio.run(main())
+
+
+
+# 【例4-5】
+# 单连接请求流水线与id多路复用: 客户端同时保持多个在途请求, 按id匹配乱序响应; 服务端并发处理流水线请求
+import asyncio
+import itertools
+import json
+import random
+import time
+
+SERVER_SUPPORTED_VERSIONS = ["1.0.0", "1.1.0", "2.0.0"]
+SERVER_CAPABILITIES = {"prompts": True, "resources": True, "tools": True, "logging": True, "experimental": False}
+
+class NewlineFramer:
+    def __init__(self, max_frame=1024 * 1024):
+        self.max_frame = max_frame
+        self.buffer = bytearray()
+        self._scanned = 0
+
+    def feed(self, data):
+        self.buffer += data
+        frames, start = [], 0
+        while True:
+            end = self.buffer.find(b"\n", max(start, self._scanned))
+            if end < 0:
+                break
+            frames.append(bytes(self.buffer[start:end]))
+            start = self._scanned = end + 1
+        if start:
+            del self.buffer[:start]
+        self._scanned = len(self.buffer)
+        if len(self.buffer) > self.max_frame:
+            raise ValueError("消息长度超过上限")
+        return frames
+
+class MCPServerProtocol(asyncio.Protocol):
+    def __init__(self, work_time=0.005):
+        """
+        :param work_time: 模拟每个请求的处理耗时(如访问数据库、调用工具)
+        """
+        self.work_time = work_time
+        self.framer = NewlineFramer()
+        self.tasks = set()
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def data_received(self, data):
+        try:
+            frames = self.framer.feed(data)
+        except ValueError:
+            self.transport.close()
+            return
+        for frame in frames:
+            # 每个请求独立成任务, 慢请求不会阻塞同一连接上的后续请求
+            task = asyncio.get_running_loop().create_task(self.handle_request(frame))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+
+    def connection_lost(self, exc):
+        for task in self.tasks:
+            task.cancel()
+
+    async def handle_request(self, frame):
+        try:
+            request = json.loads(frame)
+        except json.JSONDecodeError:
+            self.send({"jsonrpc": "2.0", "error": {"code": -32700, "message": "无效的JSON格式"}, "id": None})
+            return
+        method = request.get("method")
+        params = request.get("params", {})
+        if method == "negotiate_version":
+            version = next((v for v in params.get("versions", []) if v in SERVER_SUPPORTED_VERSIONS), None)
+            if version is None:
+                response = {"error": {"code": -32000, "message": "没有兼容的协议版本"}}
+            else:
+                response = {"result": {"version": version}}
+        elif method == "initialize":
+            caps = {k: bool(v and SERVER_CAPABILITIES.get(k, False))
+                    for k, v in params.get("capabilities", {}).items()}
+            response = {"result": {"capabilities": caps}}
+        elif method == "tools/call":
+            await asyncio.sleep(self.work_time * random.uniform(0.5, 1.5))
+            response = {"result": {"content": f"{params.get('name')} done", "arguments": params.get("arguments")}}
+        else:
+            response = {"error": {"code": -32601, "message": "未知的方法"}}
+        response.update({"jsonrpc": "2.0", "id": request.get("id")})
+        self.send(response)
+
+    def send(self, response):
+        if not self.transport.is_closing():
+            self.transport.write(json.dumps(response).encode() + b"\n")
+
+class MCPError(Exception):
+    def __init__(self, code, message):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+
+class MultiplexedMCPClient:
+    """
+    一条TCP连接上复用多个请求: 每个请求分配唯一id, 后台读循环按id唤醒对应的Future
+    """
+    def __init__(self, host, port, max_in_flight=256):
+        self.host = host
+        self.port = port
+        self._ids = itertools.count(1)
+        self.pending = {}  # id -> Future
+        self._slots = asyncio.Semaphore(max_in_flight)
+        self.reader = self.writer = self._reader_task = None
+
+    async def connect(self):
+        self.reader, self.writer = await asyncio.open_connection(self.host, self.port, limit=1024 * 1024)
+        self._reader_task = asyncio.get_running_loop().create_task(self._read_loop())
+
+    async def _read_loop(self):
+        error = ConnectionError("连接已关闭")
+        try:
+            while True:
+                line = await self.reader.readline()
+                if not line:
+                    break
+                response = json.loads(line)
+                future = self.pending.pop(response.get("id"), None)
+                if future is not None and not future.done():
+                    future.set_result(response)
+        except Exception as e:
+            error = e
+        finally:
+            for future in self.pending.values():
+                if not future.done():
+                    future.set_exception(error)
+            self.pending.clear()
+
+    async def request(self, method, params=None, timeout=10):
+        async with self._slots:
+            request_id = next(self._ids)
+            future = asyncio.get_running_loop().create_future()
+            self.pending[request_id] = future
+            message = {"jsonrpc": "2.0", "method": method, "params": params or {}, "id": request_id}
+            self.writer.write(json.dumps(message).encode() + b"\n")
+            await self.writer.drain()
+            try:
+                response = await asyncio.wait_for(future, timeout)
+            finally:
+                self.pending.pop(request_id, None)
+        if "error" in response:
+            raise MCPError(response["error"]["code"], response["error"]["message"])
+        return response["result"]
+
+    async def negotiate_version(self, versions):
+        return (await self.request("negotiate_version", {"versions": versions}))["version"]
+
+    async def initialize(self, capabilities):
+        return (await self.request("initialize", {"capabilities": capabilities}))["capabilities"]
+
+    async def close(self):
+        self.writer.close()
+        await self.writer.wait_closed()
+        if self._reader_task is not None:
+            await self._reader_task
+
+async def one_shot(host, port, method, params):
+    """
+    原有方式: 每次操作新建连接, 发送请求并等待响应后关闭
+    """
+    reader, writer = await asyncio.open_connection(host, port)
+    writer.write(json.dumps({"jsonrpc": "2.0", "method": method, "params": params, "id": 1}).encode() + b"\n")
+    await writer.drain()
+    response = json.loads(await reader.readline())
+    writer.close()
+    await writer.wait_closed()
+    return response
+
+async def main():
+    loop = asyncio.get_running_loop()
+    server = await loop.create_server(lambda: MCPServerProtocol(work_time=0.005), '127.0.0.1', 8888)
+    n = 500
+
+    start = time.perf_counter()
+    for i in range(n):
+        await one_shot('127.0.0.1', 8888, "tools/call", {"name": "calc", "arguments": {"i": i}})
+    serial = time.perf_counter() - start
+
+    client = MultiplexedMCPClient('127.0.0.1', 8888)
+    await client.connect()
+    # 握手请求同样可以流水线发出, 无需等待前一个响应
+    version, caps = await asyncio.gather(client.negotiate_version(["1.1.0", "2.0.0"]),
+                                         client.initialize({"tools": True, "experimental": True}))
+    print("协商版本:", version, "能力集:", caps)
+    start = time.perf_counter()
+    results = await asyncio.gather(*[client.request("tools/call", {"name": "calc", "arguments": {"i": i}})
+                                     for i in range(n)])
+    pipelined = time.perf_counter() - start
+    assert [r["arguments"]["i"] for r in results] == list(range(n))
+    try:
+        await client.request("unknown/method")
+    except MCPError as e:
+        print("错误响应:", e.code, e.message)
+    await client.close()
+
+    print(f"逐个建连串行: {n / serial:.0f} req/s; 单连接流水线: {n / pipelined:.0f} req/s")
+    server.close()
+    await server.wait_closed()
+
+if __name__ == "__main__":
+    asyncio.run(main())
+
+
+
+# 【例4-6】
+# 客户端连接池: 按(host, port)保持已完成协商的连接, 缓存协商出的版本与能力集, 空闲连接健康检查, 限制最小/最大连接数与空闲超时
+import asyncio
+import itertools
+import json
+import time
+from collections import deque
+
+SERVER_SUPPORTED_VERSIONS = ["1.0.0", "1.1.0", "2.0.0"]
+SERVER_CAPABILITIES = {"prompts": True, "resources": True, "tools": True, "logging": True, "experimental": False}
+SERVER_STATS = {"connections": 0, "negotiate_version": 0, "initialize": 0}
+
+class MCPServerProtocol(asyncio.Protocol):
+    """
+    换行分隔的JSON-RPC服务器; initialize可携带已协商的version, 此时服务端只校验版本, 省去单独的版本协商往返
+    """
+    def connection_made(self, transport):
+        self.transport = transport
+        self.buffer = b""
+        SERVER_STATS["connections"] += 1
+
+    def data_received(self, data):
+        *lines, self.buffer = (self.buffer + data).split(b"\n")
+        for line in lines:
+            request = json.loads(line)
+            method, params = request.get("method"), request.get("params", {})
+            if method == "negotiate_version":
+                SERVER_STATS["negotiate_version"] += 1
+                version = next((v for v in params.get("versions", []) if v in SERVER_SUPPORTED_VERSIONS), None)
+                response = ({"result": {"version": version}} if version else
+                            {"error": {"code": -32000, "message": "没有兼容的协议版本"}})
+            elif method == "initialize":
+                SERVER_STATS["initialize"] += 1
+                if params.get("version") and params["version"] not in SERVER_SUPPORTED_VERSIONS:
+                    response = {"error": {"code": -32000, "message": "没有兼容的协议版本"}}
+                else:
+                    caps = {k: bool(v and SERVER_CAPABILITIES.get(k, False))
+                            for k, v in params.get("capabilities", {}).items()}
+                    response = {"result": {"capabilities": caps}}
+            elif method == "ping":
+                response = {"result": {}}
+            elif method == "tools/call":
+                response = {"result": {"content": f"{params.get('name')} done"}}
+            else:
+                response = {"error": {"code": -32601, "message": "未知的方法"}}
+            response.update({"jsonrpc": "2.0", "id": request.get("id")})
+            self.transport.write(json.dumps(response).encode() + b"\n")
+
+class MCPError(Exception):
+    def __init__(self, code, message):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+
+class MCPConnection:
+    """
+    一条已建立的连接及其协商结果
+    """
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self._ids = itertools.count(1)
+        self.version = None
+        self.capabilities = None
+        self.last_used = time.monotonic()
+
+    async def request(self, method, params=None, timeout=5):
+        request_id = next(self._ids)
+        message = {"jsonrpc": "2.0", "method": method, "params": params or {}, "id": request_id}
+        self.writer.write(json.dumps(message).encode() + b"\n")
+        await self.writer.drain()
+        line = await asyncio.wait_for(self.reader.readline(), timeout)
+        if not line:
+            raise ConnectionError("连接已被服务端关闭")
+        response = json.loads(line)
+        if "error" in response:
+            raise MCPError(response["error"]["code"], response["error"]["message"])
+        return response["result"]
+
+    def is_closing(self):
+        return self.writer.is_closing() or self.reader.at_eof()
+
+    async def close(self):
+        self.writer.close()
+        try:
+            await self.writer.wait_closed()
+        except ConnectionError:
+            pass
+
+class HostPool:
+    def __init__(self):
+        self.idle = deque()          # 空闲连接, 右端为最近归还的连接
+        self.size = 0                # 空闲 + 借出 + 建立中
+        self.negotiated = None       # 缓存的(version, capabilities)
+        self.negotiating = None      # 首次协商进行中时为Future, 供并发连接等待
+        self.available = asyncio.Condition()
+
+class ConnectionPool:
+    def __init__(self, versions, capabilities, min_size=1, max_size=8, idle_timeout=30.0,
+                 health_check_after=5.0, connect_timeout=3.0):
+        """
+        :param min_size: 每个(host, port)至少保持的预热连接数
+        :param max_size: 每个(host, port)的连接上限, 达到上限时acquire等待归还
+        :param idle_timeout: 空闲超过该时长的连接被关闭(保留min_size个)
+        :param health_check_after: 空闲超过该时长的连接在借出前先ping
+        """
+        self.versions = versions
+        self.capabilities = capabilities
+        self.min_size = min_size
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.health_check_after = health_check_after
+        self.connect_timeout = connect_timeout
+        self.pools = {}
+        self.stats = {"created": 0, "reused": 0, "health_check_failed": 0, "evicted": 0}
+        self._reaper = None
+
+    def _pool(self, key):
+        pool = self.pools.get(key)
+        if pool is None:
+            pool = self.pools[key] = HostPool()
+        if self._reaper is None:
+            self._reaper = asyncio.get_running_loop().create_task(self._reap_loop())
+        return pool
+
+    async def _connect(self, key, pool):
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(*key), self.connect_timeout)
+        conn = MCPConnection(reader, writer)
+        try:
+            while True:
+                if pool.negotiated is None and pool.negotiating is not None:
+                    # 同一(host, port)的首次协商只由一个连接执行, 其余并发建立的连接等待其结果
+                    await asyncio.shield(pool.negotiating)
+                    continue
+                if pool.negotiated is not None:
+                    # 后续连接: 以缓存的版本初始化, 只需一次往返; 能力集以服务端本次返回为准
+                    version = pool.negotiated[0]
+                    try:
+                        result = await conn.request("initialize", {"version": version,
+                                                                   "capabilities": self.capabilities})
+                    except MCPError:
+                        # 服务端升级等原因导致缓存失效, 退回完整协商
+                        pool.negotiated = None
+                        continue
+                    pool.negotiated = (version, result["capabilities"])
+                    break
+                # 首次连接: 完整的版本协商 + 能力协商, 结果缓存供后续连接复用
+                pool.negotiating = asyncio.get_running_loop().create_future()
+                try:
+                    version = (await conn.request("negotiate_version", {"versions": self.versions}))["version"]
+                    caps = (await conn.request("initialize", {"capabilities": self.capabilities}))["capabilities"]
+                    pool.negotiated = (version, caps)
+                finally:
+                    # 协商失败时negotiated仍为None, 等待者被唤醒后会自行重试
+                    pool.negotiating.set_result(None)
+                    pool.negotiating = None
+                break
+        except BaseException:
+            await conn.close()
+            raise
+        conn.version, conn.capabilities = pool.negotiated
+        self.stats["created"] += 1
+        return conn
+
+    async def _healthy(self, conn):
+        if conn.is_closing():
+            return False
+        if time.monotonic() - conn.last_used < self.health_check_after:
+            return True
+        try:
+            await conn.request("ping", timeout=1)
+            return True
+        except (ConnectionError, MCPError, asyncio.TimeoutError, OSError):
+            return False
+
+    async def _discard(self, pool, conn):
+        pool.size -= 1
+        await conn.close()
+        async with pool.available:
+            pool.available.notify()
+
+    async def acquire(self, host, port):
+        key = (host, port)
+        pool = self._pool(key)
+        while True:
+            while pool.idle:
+                conn = pool.idle.pop()
+                if await self._healthy(conn):
+                    self.stats["reused"] += 1
+                    return conn
+                self.stats["health_check_failed"] += 1
+                await self._discard(pool, conn)
+            if pool.size < self.max_size:
+                pool.size += 1
+                try:
+                    return await self._connect(key, pool)
+                except BaseException:
+                    pool.size -= 1
+                    async with pool.available:
+                        pool.available.notify()
+                    raise
+            async with pool.available:
+                await pool.available.wait_for(lambda: pool.idle or pool.size < self.max_size)
+
+    async def release(self, host, port, conn, broken=False):
+        pool = self.pools[(host, port)]
+        if broken or conn.is_closing():
+            await self._discard(pool, conn)
+            return
+        conn.last_used = time.monotonic()
+        pool.idle.append(conn)
+        async with pool.available:
+            pool.available.notify()
+
+    async def request(self, host, port, method, params=None):
+        conn = await self.acquire(host, port)
+        try:
+            result = await conn.request(method, params)
+        except MCPError:
+            await self.release(host, port, conn)
+            raise
+        except BaseException:
+            await self.release(host, port, conn, broken=True)
+            raise
+        await self.release(host, port, conn)
+        return result
+
+    async def _reap_loop(self, interval=1.0):
+        while True:
+            await asyncio.sleep(interval)
+            now = time.monotonic()
+            for key, pool in list(self.pools.items()):
+                # 最旧的空闲连接在左端; 超时的关闭, 但保留min_size个
+                while pool.idle and pool.size > self.min_size and now - pool.idle[0].last_used > self.idle_timeout:
+                    self.stats["evicted"] += 1
+                    await self._discard(pool, pool.idle.popleft())
+                # 补足预热连接
+                while pool.size < self.min_size:
+                    pool.size += 1
+                    try:
+                        pool.idle.append(await self._connect(key, pool))
+                    except (ConnectionError, OSError, asyncio.TimeoutError, MCPError):
+                        pool.size -= 1
+                        break
+
+    async def close(self):
+        if self._reaper is not None:
+            self._reaper.cancel()
+        for pool in self.pools.values():
+            while pool.idle:
+                await pool.idle.pop().close()
+                pool.size -= 1
+
+async def unpooled_call(host, port, versions, capabilities, method, params):
+    """
+    原有方式: 每次调用新建连接, 依次完成版本协商、能力协商和实际请求
+    """
+    reader, writer = await asyncio.open_connection(host, port)
+    conn = MCPConnection(reader, writer)
+    await conn.request("negotiate_version", {"versions": versions})
+    await conn.request("initialize", {"capabilities": capabilities})
+    result = await conn.request(method, params)
+    await conn.close()
+    return result
+
+async def main():
+    loop = asyncio.get_running_loop()
+    server = await loop.create_server(MCPServerProtocol, '127.0.0.1', 8888)
+    versions = ["1.1.0", "2.0.0"]
+    capabilities = {"tools": True, "resources": True, "experimental": True}
+    n = 300
+
+    start = time.perf_counter()
+    for i in range(n):
+        await unpooled_call('127.0.0.1', 8888, versions, capabilities, "tools/call", {"name": f"t{i}"})
+    unpooled = time.perf_counter() - start
+    print(f"无连接池: {n / unpooled:.0f} req/s, 服务端统计: {SERVER_STATS}")
+
+    for k in SERVER_STATS:
+        SERVER_STATS[k] = 0
+    pool = ConnectionPool(versions, capabilities, min_size=2, max_size=8, idle_timeout=1.5, health_check_after=0.5)
+
+    async def worker(items):
+        for i in items:
+            await pool.request('127.0.0.1', 8888, "tools/call", {"name": f"t{i}"})
+
+    start = time.perf_counter()
+    await asyncio.gather(*[worker(range(w, n, 16)) for w in range(16)])
+    pooled = time.perf_counter() - start
+    print(f"连接池(16并发, max_size=8): {n / pooled:.0f} req/s, 服务端统计: {SERVER_STATS}")
+    print("协商缓存:", pool.pools[('127.0.0.1', 8888)].negotiated)
+
+    # 服务端重启: 空闲连接全部失效, 借出前的健康检查将其剔除并重新建立
+    server.close()
+    for conn in pool.pools[('127.0.0.1', 8888)].idle:
+        conn.writer.transport.abort()
+    await server.wait_closed()
+    server = await loop.create_server(MCPServerProtocol, '127.0.0.1', 8888)
+    await asyncio.sleep(0.6)
+    print("重启后调用:", await pool.request('127.0.0.1', 8888, "tools/call", {"name": "after_restart"}))
+
+    await asyncio.sleep(3)  # 等待空闲连接超时回收, 只保留min_size个
+    print("连接池统计:", pool.stats, "当前连接数:", pool.pools[('127.0.0.1', 8888)].size)
+    await pool.close()
+    server.close()
+    await server.wait_closed()
+
+if __name__ == "__main__":
+    asyncio.run(main())
+
+
+
+# 【例4-7】
+# 会话恢复票据: 服务端在initialize后签发包含版本与能力集的HMAC票据, 客户端重连时随首个请求出示, 零额外往返恢复会话
+import asyncio
+import base64
+import hashlib
+import hmac
+import itertools
+import json
+import os
+import time
+
+SERVER_SUPPORTED_VERSIONS = ["1.0.0", "1.1.0", "2.0.0"]
+SERVER_CAPABILITIES = {"prompts": True, "resources": True, "tools": True, "logging": True, "experimental": False}
+SERVER_STATS = {"initialize": 0, "resumed": 0, "rejected": 0}
+
+TICKET_INVALID = -32001
+NOT_INITIALIZED = -32002
+
+def _b64encode(data):
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+def _b64decode(text):
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+class TicketInvalid(Exception):
+    pass
+
+class TicketManager:
+    def __init__(self, ttl=3600, key_id=None, secret=None):
+        """
+        :param ttl: 票据有效期(秒)
+        密钥按key_id保存, 轮换后旧密钥签发的票据在过期前仍可验证
+        """
+        self.ttl = ttl
+        self.keys = {}
+        self.current_key_id = None
+        self.rotate(key_id, secret)
+
+    def rotate(self, key_id=None, secret=None):
+        key_id = key_id or _b64encode(os.urandom(4))
+        self.keys[key_id] = secret or os.urandom(32)
+        self.current_key_id = key_id
+        return key_id
+
+    def retire(self, key_id):
+        self.keys.pop(key_id, None)
+
+    def issue(self, version, capabilities):
+        payload = json.dumps({"kid": self.current_key_id, "v": version, "caps": capabilities,
+                              "exp": int(time.time()) + self.ttl}, separators=(",", ":")).encode()
+        body = _b64encode(payload)
+        mac = hmac.new(self.keys[self.current_key_id], body.encode("ascii"), hashlib.sha256).digest()
+        return f"{body}.{_b64encode(mac)}"
+
+    def validate(self, ticket):
+        """
+        返回(version, capabilities); 签名错误、密钥已下线、过期或版本不再支持时抛出TicketInvalid
+        """
+        # 票据来自客户端, 任何解码失败都只能表现为TicketInvalid, 不能让异常逃出data_received
+        # (binascii.Error与UnicodeError均为ValueError的子类)
+        try:
+            body, mac = ticket.split(".")
+            payload = json.loads(_b64decode(body))
+            signature = _b64decode(mac)
+            if not isinstance(payload, dict):
+                raise TypeError("payload不是对象")
+            key = self.keys[payload["kid"]]
+            expected = hmac.new(key, body.encode("ascii"), hashlib.sha256).digest()
+        except (ValueError, KeyError, TypeError, AttributeError):
+            raise TicketInvalid("票据格式错误或密钥已下线")
+        if not hmac.compare_digest(expected, signature):
+            raise TicketInvalid("票据签名无效")
+        exp, version, caps = payload.get("exp"), payload.get("v"), payload.get("caps")
+        if not isinstance(exp, (int, float)) or not isinstance(version, str) or not isinstance(caps, dict):
+            raise TicketInvalid("票据内容不完整")
+        if exp < time.time():
+            raise TicketInvalid("票据已过期")
+        if version not in SERVER_SUPPORTED_VERSIONS:
+            raise TicketInvalid("票据中的协议版本已不再支持")
+        return version, caps
+
+class MCPServerProtocol(asyncio.Protocol):
+    def __init__(self, tickets):
+        self.tickets = tickets
+        self.session = None  # (version, capabilities), 完成initialize或票据恢复后设置
+        self.buffer = b""
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def data_received(self, data):
+        *lines, self.buffer = (self.buffer + data).split(b"\n")
+        for line in lines:
+            try:
+                request = json.loads(line)
+            except (json.JSONDecodeError, UnicodeDecodeError):
+                self.send(None, {"error": {"code": -32700, "message": "无效的JSON格式"}})
+                continue
+            if not isinstance(request, dict) or not isinstance(request.get("params", {}), dict):
+                self.send(None, {"error": {"code": -32600, "message": "请求必须是JSON对象, params必须是对象"}})
+                continue
+            self.send(request.get("id"), self.handle_request(request))
+
+    def handle_request(self, request):
+        method, params = request.get("method"), request.get("params", {})
+        if method == "initialize":
+            SERVER_STATS["initialize"] += 1
+            version = next((v for v in params.get("versions", []) if v in SERVER_SUPPORTED_VERSIONS), None)
+            if version is None:
+                return {"error": {"code": -32000, "message": "没有兼容的协议版本"}}
+            caps = {k: bool(v and SERVER_CAPABILITIES.get(k, False))
+                    for k, v in params.get("capabilities", {}).items()}
+            self.session = (version, caps)
+            return {"result": {"version": version, "capabilities": caps,
+                               "resumptionTicket": self.tickets.issue(version, caps)}}
+        if self.session is None:
+            meta = params.get("_meta") if isinstance(params, dict) else None
+            ticket = meta.get("resumptionTicket") if isinstance(meta, dict) else None
+            if ticket is None:
+                return {"error": {"code": NOT_INITIALIZED, "message": "会话尚未初始化"}}
+            try:
+                self.session = self.tickets.validate(ticket)
+            except TicketInvalid as e:
+                SERVER_STATS["rejected"] += 1
+                return {"error": {"code": TICKET_INVALID, "message": str(e)}}
+            SERVER_STATS["resumed"] += 1
+        version, caps = self.session
+        if method == "tools/call":
+            if not caps.get("tools"):
+                return {"error": {"code": -32601, "message": "会话未协商tools能力"}}
+            return {"result": {"content": f"{params.get('name')} done", "version": version}}
+        return {"error": {"code": -32601, "message": "未知的方法"}}
+
+    def send(self, request_id, response):
+        response.update({"jsonrpc": "2.0", "id": request_id})
+        self.transport.write(json.dumps(response).encode() + b"\n")
+
+class MCPError(Exception):
+    def __init__(self, code, message):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+
+class ResumableMCPClient:
+    """
+    按(host, port)缓存票据; 新连接的首个请求携带票据, 被拒绝时退回完整initialize并重发该请求
+    """
+    tickets = {}
+
+    def __init__(self, host, port, versions, capabilities):
+        self.host = host
+        self.port = port
+        self.versions = versions
+        self.capabilities = capabilities
+        self._ids = itertools.count(1)
+        self.initialized = False
+        self.round_trips = 0
+
+    async def connect(self):
+        self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        self.initialized = False
+        if (self.host, self.port) not in self.tickets:
+            await self.initialize()
+
+    async def _call(self, method, params):
+        message = {"jsonrpc": "2.0", "method": method, "params": params, "id": next(self._ids)}
+        self.writer.write(json.dumps(message).encode() + b"\n")
+        await self.writer.drain()
+        self.round_trips += 1
+        response = json.loads(await self.reader.readline())
+        if "error" in response:
+            raise MCPError(response["error"]["code"], response["error"]["message"])
+        return response["result"]
+
+    async def initialize(self):
+        result = await self._call("initialize", {"versions": self.versions, "capabilities": self.capabilities})
+        self.tickets[(self.host, self.port)] = result["resumptionTicket"]
+        self.initialized = True
+        return result
+
+    async def request(self, method, params=None):
+        params = dict(params or {})
+        if not self.initialized:
+            ticket = self.tickets.get((self.host, self.port))
+            try:
+                result = await self._call(method, {**params, "_meta": {"resumptionTicket": ticket}})
+                self.initialized = True
+                return result
+            except MCPError as e:
+                if e.code not in (TICKET_INVALID, NOT_INITIALIZED):
+                    raise
+                self.tickets.pop((self.host, self.port), None)
+                await self.initialize()
+        return await self._call(method, params)
+
+    async def close(self):
+        self.writer.close()
+        await self.writer.wait_closed()
+
+async def main():
+    loop = asyncio.get_running_loop()
+    tickets = TicketManager(ttl=2)
+    server = await loop.create_server(lambda: MCPServerProtocol(tickets), '127.0.0.1', 8888)
+    versions, caps = ["1.1.0", "2.0.0"], {"tools": True, "experimental": True}
+
+    async def reconnect_and_call(label):
+        client = ResumableMCPClient('127.0.0.1', 8888, versions, caps)
+        start = time.perf_counter()
+        await client.connect()
+        result = await client.request("tools/call", {"name": "calc"})
+        elapsed = (time.perf_counter() - start) * 1000
+        await client.close()
+        print(f"{label}: 往返{client.round_trips}次, {elapsed:.2f}ms, 结果: {result}, 服务端: {SERVER_STATS}")
+
+    await reconnect_and_call("首次连接(完整initialize)")
+    await reconnect_and_call("重连(票据恢复)")
+
+    # 篡改票据中的能力集: 签名校验失败, 客户端自动退回完整initialize
+    key = ('127.0.0.1', 8888)
+    body, mac = ResumableMCPClient.tickets[key].split(".")
+    forged = json.loads(_b64decode(body))
+    forged["caps"]["experimental"] = True
+    ResumableMCPClient.tickets[key] = _b64encode(json.dumps(forged, separators=(",", ":")).encode()) + "." + mac
+    await reconnect_and_call("篡改票据")
+
+    # 密钥轮换: 旧密钥仍在验证集合中, 已签发的票据继续有效
+    tickets.rotate()
+    await reconnect_and_call("密钥轮换后重连")
+
+    await asyncio.sleep(2.5)
+    await reconnect_and_call("票据过期")
+
+    server.close()
+    await server.wait_closed()
+
+if __name__ == "__main__":
+    asyncio.run(main())
+
+
+
+# 【例4-8】
+# MCPServerProtocol背压: 写缓冲区高低水位配合pause_writing/resume_writing, 请求队列满时pause_reading, 全局在途请求数上限
+import asyncio
+import json
+import time
+
+class FrameTooLarge(Exception):
+    pass
+
+class NewlineFramer:
+    """
+    与例4-4相同的增量换行分帧, 未完成的消息超过max_frame时抛出FrameTooLarge
+    """
+    def __init__(self, max_frame=1024 * 1024):
+        self.max_frame = max_frame
+        self.buffer = bytearray()
+        self._scanned = 0
+
+    def feed(self, data):
+        self.buffer += data
+        frames, start = [], 0
+        while True:
+            end = self.buffer.find(b"\n", max(start, self._scanned))
+            if end < 0:
+                break
+            if end - start > self.max_frame:
+                raise FrameTooLarge(f"消息长度超过上限{self.max_frame}字节")
+            frames.append(bytes(self.buffer[start:end]))
+            start = self._scanned = end + 1
+        if start:
+            del self.buffer[:start]
+        self._scanned = len(self.buffer)
+        if len(self.buffer) > self.max_frame:
+            raise FrameTooLarge(f"未完成的消息已超过上限{self.max_frame}字节")
+        return frames
+
+class NaiveServerProtocol(asyncio.Protocol):
+    """
+    对照组: 与例4-2/4-3相同, 收到请求即处理并直接transport.write, 不检查缓冲区
+    """
+    instances = []
+
+    def __init__(self, response_size):
+        self.response_size = response_size
+        self.buffer = b""
+        NaiveServerProtocol.instances.append(self)
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def data_received(self, data):
+        *lines, self.buffer = (self.buffer + data).split(b"\n")
+        for line in lines:
+            request = json.loads(line)
+            response = {"jsonrpc": "2.0", "result": {"data": "x" * self.response_size}, "id": request["id"]}
+            self.transport.write(json.dumps(response).encode() + b"\n")
+
+    def memory(self):
+        return self.transport.get_write_buffer_size() + len(self.buffer)
+
+class BackpressureServerProtocol(asyncio.Protocol):
+    instances = []
+
+    def __init__(self, inflight, response_size, queue_size=64, workers=4,
+                 high_water=256 * 1024, low_water=64 * 1024, work_time=0.001, max_frame=64 * 1024):
+        """
+        :param inflight: 所有连接共享的信号量, 限制全局同时处理的请求数
+        :param queue_size: 单连接待处理请求上限, 达到后暂停读取该连接
+        :param high_water/low_water: 写缓冲区水位, 超过高水位时暂停发送响应, 降到低水位以下后恢复
+        :param max_frame: 单条请求的长度上限, 同时限制了读缓冲区的大小
+        """
+        self.inflight = inflight
+        self.response_size = response_size
+        self.queue_size = queue_size
+        self.workers = workers
+        self.high_water = high_water
+        self.low_water = low_water
+        self.work_time = work_time
+        self.framer = NewlineFramer(max_frame)
+        self.queue = asyncio.Queue()
+        self.can_write = asyncio.Event()
+        self.can_write.set()
+        self.reading_paused = False
+        self.stats = {"pause_reading": 0, "pause_writing": 0}
+        BackpressureServerProtocol.instances.append(self)
+
+    def connection_made(self, transport):
+        self.transport = transport
+        transport.set_write_buffer_limits(high=self.high_water, low=self.low_water)
+        loop = asyncio.get_running_loop()
+        self.tasks = [loop.create_task(self._worker()) for _ in range(self.workers)]
+
+    def connection_lost(self, exc):
+        for task in self.tasks:
+            task.cancel()
+        self.can_write.set()
+
+    # ---------- 流量控制回调: 由传输层在写缓冲区越过水位时调用 ----------
+    def pause_writing(self):
+        self.stats["pause_writing"] += 1
+        self.can_write.clear()
+
+    def resume_writing(self):
+        self.can_write.set()
+
+    def data_received(self, data):
+        try:
+            lines = self.framer.feed(data)
+        except FrameTooLarge as e:
+            # 不带换行的超长数据无法再定位消息边界, 回复错误后断开, 读缓冲区不会无限增长
+            self.transport.write(json.dumps({"jsonrpc": "2.0", "id": None,
+                                             "error": {"code": -32600, "message": str(e)}}).encode() + b"\n")
+            self.transport.close()
+            return
+        for line in lines:
+            self.queue.put_nowait(line)
+        # 单次读取最多带来一个读缓冲区的数据, 因此队列超出上限的部分是有界的
+        if self.queue.qsize() >= self.queue_size and not self.reading_paused:
+            self.reading_paused = True
+            self.stats["pause_reading"] += 1
+            self.transport.pause_reading()
+
+    async def _worker(self):
+        while True:
+            line = await self.queue.get()
+            if self.reading_paused and self.queue.qsize() <= self.queue_size // 2:
+                self.reading_paused = False
+                self.transport.resume_reading()
+            # 单个请求出错只影响该请求, worker继续处理后续请求
+            try:
+                request = json.loads(line)
+            except (json.JSONDecodeError, UnicodeDecodeError):
+                await self._reply({"jsonrpc": "2.0", "id": None,
+                                   "error": {"code": -32700, "message": "无效的JSON格式"}})
+                continue
+            if not isinstance(request, dict) or not isinstance(request.get("method"), str):
+                await self._reply({"jsonrpc": "2.0", "id": request.get("id") if isinstance(request, dict) else None,
+                                   "error": {"code": -32600, "message": "无效的请求"}})
+                continue
+            try:
+                async with self.inflight:
+                    await asyncio.sleep(self.work_time)  # 模拟请求处理
+                    result = {"data": "x" * self.response_size}
+            except Exception as e:
+                response = {"error": {"code": -32603, "message": str(e)}}
+            else:
+                response = {"result": result}
+            # 不带id的通知不需要响应
+            if "id" not in request:
+                continue
+            response.update({"jsonrpc": "2.0", "id": request["id"]})
+            await self._reply(response)
+
+    async def _reply(self, response):
+        # 客户端读取过慢时在此等待, 而不是继续往写缓冲区堆积
+        await self.can_write.wait()
+        if not self.transport.is_closing():
+            self.transport.write(json.dumps(response).encode() + b"\n")
+
+    def memory(self):
+        return self.transport.get_write_buffer_size() + len(self.framer.buffer) + self.queue.qsize() * 64
+
+async def slow_client(port, n, stop):
+    """
+    快速发送大量请求但几乎不读取响应的客户端
+    """
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    async def send():
+        for i in range(n):
+            writer.write(json.dumps({"jsonrpc": "2.0", "method": "tools/call", "id": i}).encode() + b"\n")
+            await writer.drain()  # 服务端暂停读取后, 这里会因TCP窗口填满而阻塞
+    sender = asyncio.get_running_loop().create_task(send())
+    await stop.wait()
+    sender.cancel()
+    writer.transport.abort()
+
+async def normal_client(port, n, latencies):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    for i in range(n):
+        start = time.perf_counter()
+        writer.write(json.dumps({"jsonrpc": "2.0", "method": "tools/call", "id": i}).encode() + b"\n")
+        await writer.drain()
+        await reader.readline()
+        latencies.append((time.perf_counter() - start) * 1000)
+        await asyncio.sleep(0.01)
+    writer.close()
+    await writer.wait_closed()
+
+async def run(label, factory, instances, duration=2.0):
+    loop = asyncio.get_running_loop()
+    server = await loop.create_server(factory, '127.0.0.1', 0)
+    port = server.sockets[0].getsockname()[1]
+    stop = asyncio.Event()
+    peak = 0
+
+    async def sample():
+        nonlocal peak
+        while not stop.is_set():
+            peak = max(peak, sum(p.memory() for p in instances if not p.transport.is_closing()))
+            await asyncio.sleep(0.01)
+
+    latencies = []
+    slow = [loop.create_task(slow_client(port, 5000, stop)) for _ in range(4)]
+    sampler = loop.create_task(sample())
+    await asyncio.sleep(0.2)
+    await asyncio.wait_for(normal_client(port, int(duration / 0.012), latencies), duration * 5)
+    stop.set()
+    await asyncio.gather(*slow, sampler)
+    server.close()
+    await server.wait_closed()
+    latencies.sort()
+    print(f"{label}: 服务端缓冲峰值 {peak / 1024 / 1024:.1f}MB, 正常客户端延迟 "
+          f"p50={latencies[len(latencies) // 2]:.2f}ms p99={latencies[int(len(latencies) * 0.99)]:.2f}ms")
+
+async def main():
+    response_size = 16 * 1024
+    await run("无背压", lambda: NaiveServerProtocol(response_size), NaiveServerProtocol.instances)
+    inflight = asyncio.Semaphore(32)
+    await run("有背压", lambda: BackpressureServerProtocol(inflight, response_size),
+              BackpressureServerProtocol.instances)
+    totals = {"pause_reading": 0, "pause_writing": 0}
+    for p in BackpressureServerProtocol.instances:
+        for k in totals:
+            totals[k] += p.stats[k]
+    print("流量控制触发次数:", totals)
+
+if __name__ == "__main__":
+    asyncio.run(main())
+
+
+
+# 【例4-9】
+# 协议压测工具: N个并发连接完成版本/能力协商后按开环目标速率发送流水线请求, 输出吞吐与经协调遗漏校正的p50/p99/p999延迟(JSON)
+import argparse
+import asyncio
+import itertools
+import json
+import math
+import random
+import sys
+import time
+
+SERVER_SUPPORTED_VERSIONS = ["1.0.0", "1.1.0", "2.0.0"]
+SERVER_CAPABILITIES = {"prompts": True, "resources": True, "tools": True, "logging": True, "experimental": False}
+
+class MCPServerProtocol(asyncio.Protocol):
+    """
+    被测服务端: 换行分帧, 每个请求独立成任务并发处理(与例4-5一致)
+    """
+    def __init__(self, work_time=0.0):
+        self.work_time = work_time
+        self.buffer = b""
+        self.tasks = set()
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def connection_lost(self, exc):
+        for task in self.tasks:
+            task.cancel()
+
+    def data_received(self, data):
+        *lines, self.buffer = (self.buffer + data).split(b"\n")
+        for line in lines:
+            task = asyncio.get_running_loop().create_task(self.handle_request(json.loads(line)))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+
+    async def handle_request(self, request):
+        method, params = request.get("method"), request.get("params", {})
+        if method == "negotiate_version":
+            version = next((v for v in params.get("versions", []) if v in SERVER_SUPPORTED_VERSIONS), None)
+            response = ({"result": {"version": version}} if version else
+                        {"error": {"code": -32000, "message": "没有兼容的协议版本"}})
+        elif method == "initialize":
+            caps = {k: bool(v and SERVER_CAPABILITIES.get(k, False))
+                    for k, v in params.get("capabilities", {}).items()}
+            response = {"result": {"capabilities": caps}}
+        elif method == "tools/call":
+            if self.work_time:
+                await asyncio.sleep(self.work_time)
+            response = {"result": {"content": "ok"}}
+        else:
+            response = {"error": {"code": -32601, "message": "未知的方法"}}
+        response.update({"jsonrpc": "2.0", "id": request.get("id")})
+        if not self.transport.is_closing():
+            self.transport.write(json.dumps(response).encode() + b"\n")
+
+def percentile(sorted_values, q):
+    """
+    最近秩法百分位数, sorted_values需已排序
+    """
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(q / 100.0 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+def summarize(values_ms):
+    values = sorted(values_ms)
+    if not values:
+        return {"count": 0}
+    return {
+        "count": len(values),
+        "mean_ms": round(sum(values) / len(values), 3),
+        "p50_ms": round(percentile(values, 50), 3),
+        "p99_ms": round(percentile(values, 99), 3),
+        "p999_ms": round(percentile(values, 99.9), 3),
+        "max_ms": round(values[-1], 3)
+    }
+
+class LoadConnection:
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self._ids = itertools.count(1)
+        self.pending = {}  # id -> (计划发送时间, 实际发送时间, Future)
+        self.corrected = []    # 以计划发送时间为起点的延迟(校正协调遗漏)
+        self.uncorrected = []  # 以实际发送时间为起点的延迟
+        self.errors = 0
+        self.unmatched = 0     # 无法按id匹配的响应数
+        self.unanswered = 0    # 连接关闭时仍未收到响应的请求数
+        self.reader_task = None
+
+    async def connect_and_negotiate(self, versions, capabilities):
+        start = time.perf_counter()
+        self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        self.reader_task = asyncio.get_running_loop().create_task(self._read_loop())
+        await self._call("negotiate_version", {"versions": versions})
+        await self._call("initialize", {"capabilities": capabilities})
+        return (time.perf_counter() - start) * 1000
+
+    def _send(self, method, params, intended):
+        request_id = next(self._ids)
+        future = asyncio.get_running_loop().create_future()
+        self.pending[request_id] = (intended, time.perf_counter(), future)
+        self.writer.write(json.dumps({"jsonrpc": "2.0", "method": method, "params": params,
+                                      "id": request_id}).encode() + b"\n")
+        return future
+
+    async def _call(self, method, params):
+        # 握手请求不计入请求延迟统计
+        response = await self._send(method, params, None)
+        if "error" in response:
+            raise RuntimeError(response["error"]["message"])
+        return response["result"]
+
+    async def _read_loop(self):
+        error = ConnectionError("连接已关闭")
+        try:
+            while True:
+                line = await self.reader.readline()
+                if not line:
+                    break
+                now = time.perf_counter()
+                try:
+                    response = json.loads(line)
+                    entry = self.pending.pop(response.get("id"), None)
+                except (json.JSONDecodeError, AttributeError, TypeError):
+                    entry = None
+                if entry is None:
+                    # id为null(解析错误等)或未知的响应无法对应到请求, 计为错误
+                    self.unmatched += 1
+                    continue
+                intended, sent, future = entry
+                if not future.done():
+                    future.set_result(response)
+                if intended is not None:
+                    if "error" in response:
+                        self.errors += 1
+                    self.corrected.append((now - intended) * 1000)
+                    self.uncorrected.append((now - sent) * 1000)
+        except Exception as e:
+            error = e
+        finally:
+            # 无论读循环因何退出, 所有等待中的请求都立即失败, 不会让调用方永久挂起
+            for _, _, future in self.pending.values():
+                if not future.done():
+                    future.set_exception(error)
+            self.unanswered += len(self.pending)
+            self.pending.clear()
+
+    async def run_open_loop(self, rate, duration, start_at):
+        """
+        开环发送: 第k个请求的计划时间固定为start_at + k/rate, 不等待前一个响应;
+        发送方落后于计划时立即补发, 延迟仍从计划时间起算, 避免服务端变慢时样本被"省略"
+        """
+        interval = 1.0 / rate
+        futures = []
+        for k in range(int(rate * duration)):
+            intended = start_at + k * interval
+            delay = intended - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            futures.append(self._send("tools/call", {"name": "bench", "arguments": {"k": k}}, intended))
+            # 只在写缓冲区积压时等待, 正常情况下请求直接流水线发出
+            if self.writer.transport.get_write_buffer_size() > 64 * 1024:
+                await self.writer.drain()
+        await asyncio.gather(*futures, return_exceptions=True)
+
+    async def close(self, abort=False):
+        if self.reader_task is None:
+            return
+        if abort:
+            self.writer.transport.abort()
+        else:
+            self.writer.close()
+        try:
+            await self.writer.wait_closed()
+        except (ConnectionError, OSError):
+            pass
+        await self.reader_task
+
+async def run_benchmark(host, port, connections=50, rate=5000.0, duration=5.0,
+                        versions=("1.1.0", "2.0.0"), capabilities=None, deadline=None):
+    """
+    :param rate: 所有连接合计的目标请求速率(req/s), 平均分配到各连接
+    :param deadline: 整个压测(握手+发送+等待响应)的最长耗时, 默认duration + 10秒; 超时后强制断开并照常输出报告
+    """
+    capabilities = capabilities or {"tools": True, "resources": True}
+    conns = [LoadConnection(host, port) for _ in range(connections)]
+    give_up_at = time.perf_counter() + (deadline if deadline is not None else duration + 10.0)
+    timed_out = False
+    handshake, setup_elapsed, elapsed = [], 0.0, 0.0
+
+    try:
+        start = time.perf_counter()
+        handshake = await asyncio.wait_for(
+            asyncio.gather(*[c.connect_and_negotiate(list(versions), capabilities) for c in conns]),
+            give_up_at - time.perf_counter())
+        setup_elapsed = time.perf_counter() - start
+
+        per_conn_rate = rate / connections
+        # 各连接的发送时刻错开, 避免所有连接在同一瞬间突发
+        base = time.perf_counter() + 0.05
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(
+                asyncio.gather(*[c.run_open_loop(per_conn_rate, duration, base + random.random() / per_conn_rate)
+                                 for c in conns]),
+                give_up_at - time.perf_counter())
+        finally:
+            elapsed = time.perf_counter() - start
+    except asyncio.TimeoutError:
+        timed_out = True
+    finally:
+        for c in conns:
+            await c.close(abort=timed_out)
+
+    corrected = [v for c in conns for v in c.corrected]
+    uncorrected = [v for c in conns for v in c.uncorrected]
+    return {
+        "config": {"host": host, "port": port, "connections": connections, "target_rate": rate,
+                   "duration_s": duration},
+        "timed_out": timed_out,
+        "connect": {
+            "connections_per_s": round(connections / setup_elapsed, 1) if setup_elapsed else None,
+            "handshake_latency": summarize(handshake)
+        },
+        "requests": {
+            "completed": len(corrected),
+            "errors": sum(c.errors + c.unmatched + c.unanswered for c in conns),
+            "unmatched_responses": sum(c.unmatched for c in conns),
+            "unanswered": sum(c.unanswered for c in conns),
+            "throughput_rps": round(len(corrected) / elapsed, 1) if elapsed else 0.0,
+            "latency": summarize(corrected),
+            "latency_uncorrected": summarize(uncorrected)
+        }
+    }
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="MCP协议服务端压测")
+    parser.add_argument("--host", default="127.0.0.1")
+    # 内置服务端与压测端共用一个事件循环, 只适合冒烟测试; 正式测量时应单独启动服务端并指定端口
+    parser.add_argument("--port", type=int, default=0, help="0表示在本进程内启动被测服务端")
+    parser.add_argument("--connections", type=int, default=50)
+    parser.add_argument("--rate", type=float, default=5000.0, help="目标总请求速率(req/s)")
+    parser.add_argument("--duration", type=float, default=5.0)
+    parser.add_argument("--work-time", type=float, default=0.0, help="内置服务端每个请求的模拟处理耗时(秒)")
+    parser.add_argument("--deadline", type=float, help="压测总耗时上限(秒), 默认duration + 10")
+    parser.add_argument("--output", help="JSON结果写入的文件, 默认输出到标准输出")
+    return parser.parse_args(argv)
+
+async def main(argv=None):
+    args = parse_args(argv)
+    server = None
+    port = args.port
+    if port == 0:
+        loop = asyncio.get_running_loop()
+        server = await loop.create_server(lambda: MCPServerProtocol(args.work_time), args.host, 0)
+        port = server.sockets[0].getsockname()[1]
+    report = await run_benchmark(args.host, port, args.connections, args.rate, args.duration,
+                                 deadline=args.deadline)
+    report["timestamp"] = time.strftime("%Y-%m-%dT%H:%M:%S")
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        print(text)
+    if server is not None:
+        server.close()
+        await server.wait_closed()
+
+if __name__ == "__main__":
+    asyncio.run(main(sys.argv[1:]))
\ No newline at end of file
@@ -731,6 +731,758 @@ async def run_client():
             print("[Client] slot info:", slot_info)
 
 
+async def main():
+    server_task = asyncio.create_task(run_server())
+    client_task = asyncio.create_task(run_client())
+    await asyncio.gather(server_task, client_task)
+
+if __name__ == "__main__":
+    asyncio.run(main())
+
+
+
+# 【例9-5】
+import os
+import time
+import random
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Callable, Optional
+
+import mcp
+from mcp.server import FastMCP
+from mcp import ClientSession
+from mcp.client.stdio import stdio_client
+from mcp.client.stdio import StdioServerParameters
+
+#####################
+# Mock corpora: 多个知识库并行存在
+#####################
+SCIENCE_DOCS = [
+    "Quantum physics deals with subatomic particles",
+    "Neural networks are biologically inspired computing systems",
+    "Climate change impacts global temperature and weather patterns"
+]
+
+INDUSTRY_DOCS = [
+    "Industry 4.0 emphasizes automation and data exchange in manufacturing technologies",
+    "An intelligent system can leverage big data for predictive maintenance in factories",
+    "Regulatory compliance in pharmaceutical sector requires strict documentation"
+]
+
+PLATFORM_DOCS = [
+    "Document A: Cloud computing resources can be scaled up or down automatically.",
+    "Document C: RAG combines vector search with generative capabilities, enabling knowledge infusion.",
+    "Document D: MCP provides a unified context protocol for various AI tools and services."
+]
+
+def mock_embed(text: str, dim: int) -> List[float]:
+    seed = abs(hash(text)) % (10**6)
+    rng = random.Random(seed)
+    return [rng.random() for _ in range(dim)]
+
+#####################
+# Named vector index
+#####################
+class NamedIndex:
+    """
+    单个命名索引, 各自使用不同的向量维度, 因此原始L2距离不可直接比较
+    latency模拟慢索引(远程库、冷缓存等)
+    """
+    def __init__(self, name: str, docs: List[str], dim: int, latency: float = 0.0):
+        self.name = name
+        self.dim = dim
+        self.latency = latency
+        self.index = [(i, mock_embed(d, dim), d) for i, d in enumerate(docs)]
+
+    def search(self, query: str, top_k: int) -> List[Dict[str, Any]]:
+        if self.latency:
+            time.sleep(self.latency)
+        qv = mock_embed(query, self.dim)
+        results = []
+        for doc_id, vec, text in self.index:
+            dist = sum((q - v)**2 for q, v in zip(qv, vec))**0.5
+            results.append({"doc_id": doc_id, "distance": dist, "text": text})
+        results.sort(key=lambda x: x["distance"])
+        return results[:top_k]
+
+#####################
+# Federated registry
+#####################
+# name -> {"search": callable, "distance_scale": float, "timeout": float,
+#          "max_concurrency": int, "executor": ThreadPoolExecutor, "inflight": int}
+INDEX_REGISTRY: Dict[str, Dict[str, Any]] = {}
+
+def register_index(name: str, search_fn: Callable[[str, int], List[Dict[str, Any]]],
+                   distance_scale: float, timeout: float = 1.0, max_concurrency: int = 2):
+    """
+    注册一个可被联邦检索的索引
+    search_fn: (query, top_k) -> [{"doc_id", "distance", "text"}, ...]
+    distance_scale: 该索引距离的理论上界, 用于把距离归一化到[0, 1]的相似度
+    timeout: 单索引超时(秒), 超时的索引不阻塞整体结果
+    max_concurrency: 该索引专用线程池的大小; 仍在运行的检索数达到上限时直接返回busy
+    """
+    INDEX_REGISTRY[name] = {
+        "search": search_fn,
+        "distance_scale": distance_scale,
+        "timeout": timeout,
+        "max_concurrency": max_concurrency,
+        "executor": ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix=f"index-{name}"),
+        "inflight": 0
+    }
+
+def normalize_score(distance: float, distance_scale: float) -> float:
+    """
+    距离 -> 相似度: 1 - distance / distance_scale, 截断到[0, 1]
+    """
+    if distance_scale <= 0:
+        return 0.0
+    return max(0.0, min(1.0, 1.0 - distance / distance_scale))
+
+async def _query_one(name: str, query: str, top_k: int) -> Dict[str, Any]:
+    entry = INDEX_REGISTRY[name]
+    start = time.perf_counter()
+    if entry["inflight"] >= entry["max_concurrency"]:
+        # 之前超时的检索仍占满该索引的线程, 不再排队等待, 也不挤占其他索引
+        return {"name": name, "status": "busy", "elapsed_ms": 0.0, "hits": []}
+
+    def _done(fut):
+        # 线程真正结束后才释放名额; 超时后才失败的检索在此取走异常, 避免"never retrieved"警告
+        entry["inflight"] -= 1
+        if not fut.cancelled():
+            fut.exception()
+
+    entry["inflight"] += 1
+    fut = asyncio.get_running_loop().run_in_executor(entry["executor"], entry["search"], query, top_k)
+    fut.add_done_callback(_done)
+    try:
+        # 同步检索放到该索引专用的线程池执行, wait_for控制单索引超时
+        # shield保证超时只放弃等待, 名额仍由仍在运行的线程占用直到其跑完
+        hits = await asyncio.wait_for(asyncio.shield(fut), timeout=entry["timeout"])
+        status = "ok"
+    except asyncio.TimeoutError:
+        hits, status = [], "timeout"
+    except Exception as e:
+        hits, status = [], f"error: {e}"
+    elapsed_ms = round((time.perf_counter() - start) * 1000, 2)
+    normalized = []
+    for h in hits:
+        normalized.append({
+            "source": name,
+            "doc_id": h["doc_id"],
+            "score": round(normalize_score(h["distance"], entry["distance_scale"]), 4),
+            "raw_distance": round(h["distance"], 4),
+            "text": h["text"]
+        })
+    return {"name": name, "status": status, "elapsed_ms": elapsed_ms, "hits": normalized}
+
+async def federated_search(query: str, top_k: int = 5,
+                           indexes: Optional[List[str]] = None) -> Dict[str, Any]:
+    """
+    并行扇出到所有(或指定)索引, 归一化后合并为单一排序列表
+    """
+    names = [n for n in (indexes or INDEX_REGISTRY.keys()) if n in INDEX_REGISTRY]
+    per_index = await asyncio.gather(*[_query_one(n, query, top_k) for n in names])
+    merged = []
+    sources = {}
+    for r in per_index:
+        merged.extend(r["hits"])
+        sources[r["name"]] = {
+            "status": r["status"],
+            "elapsed_ms": r["elapsed_ms"],
+            "hit_count": len(r["hits"])
+        }
+    merged.sort(key=lambda h: h["score"], reverse=True)
+    for rank, h in enumerate(merged[:top_k]):
+        h["rank"] = rank + 1
+    return {"query": query, "hits": merged[:top_k], "sources": sources}
+
+# 注册三个知识库, 其中platform库模拟慢索引
+SCIENCE_INDEX = NamedIndex("science", SCIENCE_DOCS, dim=64)
+INDUSTRY_INDEX = NamedIndex("industry", INDUSTRY_DOCS, dim=32)
+PLATFORM_INDEX = NamedIndex("platform", PLATFORM_DOCS, dim=16, latency=1.5)
+
+# 向量各分量位于[0, 1), 故dim维L2距离上界为sqrt(dim)
+register_index("science", SCIENCE_INDEX.search, distance_scale=64**0.5, timeout=0.5)
+register_index("industry", INDUSTRY_INDEX.search, distance_scale=32**0.5, timeout=0.5)
+register_index("platform", PLATFORM_INDEX.search, distance_scale=16**0.5, timeout=0.5)
+
+#####################
+# MCP server
+#####################
+app = FastMCP("federated-search-demo")
+
+@app.tool()
+async def tool_federated_search(query: str, top_k: int = 5,
+                                indexes: Optional[List[str]] = None) -> Dict[str, Any]:
+    """
+    联邦检索: 同时查询多个命名索引, 返回带来源标注的合并排序结果
+    """
+    return await federated_search(query, top_k, indexes)
+
+@app.tool()
+def tool_list_indexes() -> Dict[str, Any]:
+    """
+    查看已注册的索引及其归一化尺度、超时与并发配置
+    """
+    return {
+        name: {"distance_scale": round(e["distance_scale"], 4), "timeout": e["timeout"],
+               "max_concurrency": e["max_concurrency"], "inflight": e["inflight"]}
+        for name, e in INDEX_REGISTRY.items()
+    }
+
+#####################
+# demonstration
+#####################
+async def run_server():
+    print("=== MCP服务器(federated-search-demo) 启动... ===")
+    app.run(transport="stdio")
+
+async def run_client():
+    print("=== 客户端等待3秒后开始连接... ===")
+    await asyncio.sleep(3)
+    server_params = StdioServerParameters(
+        command="python",
+        args=[os.path.abspath(__file__)]
+    )
+    async with stdio_client(server_params) as (read, write):
+        async with ClientSession(read, write) as session:
+            print("[Client] Federated search demonstration")
+            await session.initialize()
+
+            idx_info = await session.call_tool("tool_list_indexes", {})
+            print("[Client] 已注册索引:", idx_info)
+
+            # platform索引延迟1.5秒, 超过0.5秒超时, 结果中标记为timeout
+            res = await session.call_tool("tool_federated_search", {
+                "query": "data driven automation in factories",
+                "top_k": 5
+            })
+            print("[Client] 联邦检索结果:", res)
+
+            # 仅查询指定索引
+            res2 = await session.call_tool("tool_federated_search", {
+                "query": "subatomic particles",
+                "top_k": 3,
+                "indexes": ["science", "industry"]
+            })
+            print("[Client] 指定索引检索结果:", res2)
+
+async def main():
+    server_task = asyncio.create_task(run_server())
+    client_task = asyncio.create_task(run_client())
+    await asyncio.gather(server_task, client_task)
+
+if __name__ == "__main__":
+    asyncio.run(main())
+
+
+
+# 【例9-6】
+import os
+import sys
+import time
+import json
+import asyncio
+from typing import Dict, Any
+
+import numpy as np
+import faiss
+import mcp
+from mcp.server import FastMCP
+from mcp.client.stdio import stdio_client
+from mcp import ClientSession, StdioServerParameters
+
+# Prometheus Python客户端
+from prometheus_client import start_http_server, Histogram, Counter
+
+############################
+# Mock: Embedding function
+############################
+def mock_text_to_vector(text: str, dim: int = 64) -> np.ndarray:
+    rng = np.random.RandomState(abs(hash(text)) % (10**6))
+    return rng.rand(dim).astype('float32')
+
+TEXT_DB = [
+    "Quantum physics deals with subatomic particles",
+    "Machine learning relies on data-driven approaches",
+    "Neural networks are biologically inspired computing systems",
+    "FAISS is a popular library for vector similarity search",
+    "RAG is retrieval augmented generation to combine external knowledge with LLMs",
+    "MCP provides a standardized context protocol for LLM-based solutions"
+]
+
+EMB_DIM = 64
+VECTORS = np.vstack([mock_text_to_vector(doc, EMB_DIM) for doc in TEXT_DB])
+faiss_index = faiss.IndexFlatL2(EMB_DIM)
+faiss_index.add(VECTORS)
+ID_TO_TEXT = {i: TEXT_DB[i] for i in range(len(TEXT_DB))}
+
+############################
+# Metrics
+############################
+# 检索热路径各阶段耗时, 桶边界覆盖50us~1s
+STAGE_LATENCY = Histogram(
+    'mcp_vector_search_stage_seconds',
+    'Latency of each vector search stage in seconds',
+    ['stage'],
+    buckets=(0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+             0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+)
+SEARCH_COUNT = Counter('mcp_vector_search_total', 'Total number of vector searches')
+
+STAGES = ["embed", "search", "fetch_text", "build_result", "total"]
+# 预先绑定label子指标, 热路径上避免每次调用都做label查找
+_STAGE_HIST = {stage: STAGE_LATENCY.labels(stage=stage) for stage in STAGES}
+
+def histogram_summary(stage: str) -> Dict[str, Any]:
+    """
+    从Histogram的累计桶中估算分位数(返回所在桶的上界)
+    """
+    buckets, count, total = [], 0.0, 0.0
+    for metric in STAGE_LATENCY.collect():
+        for s in metric.samples:
+            if s.labels.get("stage") != stage:
+                continue
+            if s.name.endswith("_bucket"):
+                buckets.append((float(s.labels["le"]), s.value))
+            elif s.name.endswith("_count"):
+                count = s.value
+            elif s.name.endswith("_sum"):
+                total = s.value
+    buckets.sort()
+
+    def quantile(q: float):
+        target = q * count
+        for le, cumulative in buckets:
+            if cumulative >= target:
+                return None if le == float("inf") else round(le * 1000, 3)
+        return None
+
+    return {
+        "count": int(count),
+        "mean_ms": round(total / count * 1000, 4) if count else 0.0,
+        "p50_ms": quantile(0.5) if count else 0.0,
+        "p90_ms": quantile(0.9) if count else 0.0,
+        "p99_ms": quantile(0.99) if count else 0.0
+    }
+
+############################
+# MCP server definition
+############################
+app = FastMCP("faiss-vector-search-instrumented")
+
+@app.tool()
+def tool_vector_search(query_text: str, top_k: int = 3) -> Dict[str, Any]:
+    """
+    与例9-1相同的检索逻辑, 每次调用记录embed/search/fetch_text/build_result分阶段耗时
+    """
+    SEARCH_COUNT.inc()
+    t0 = time.perf_counter()
+    query_vec = mock_text_to_vector(query_text, EMB_DIM).reshape(1, -1)
+    t1 = time.perf_counter()
+    distances, indices = faiss_index.search(query_vec, top_k)
+    t2 = time.perf_counter()
+    texts = [ID_TO_TEXT[int(idx)] if idx >= 0 else None for idx in indices[0]]
+    t3 = time.perf_counter()
+    hits = []
+    for idx, dist, text in zip(indices[0], distances[0], texts):
+        if text is None:
+            continue
+        hits.append({"doc_id": int(idx), "score": float(dist), "text": text})
+    result = {"query_embedding": "omitted_for_demo", "hits": hits}
+    t4 = time.perf_counter()
+    _STAGE_HIST["embed"].observe(t1 - t0)
+    _STAGE_HIST["search"].observe(t2 - t1)
+    _STAGE_HIST["fetch_text"].observe(t3 - t2)
+    _STAGE_HIST["build_result"].observe(t4 - t3)
+    _STAGE_HIST["total"].observe(t4 - t0)
+    return result
+
+@app.tool()
+def index_stats() -> Dict[str, Any]:
+    """
+    查看索引规模、内存占用以及各阶段延迟分布
+    build_result只计组装结果字典的耗时; JSON序列化由FastMCP在工具返回后完成, 不在total之内
+    """
+    vector_bytes = int(VECTORS.nbytes)
+    # IndexFlatL2按float32原样存储全部向量
+    index_bytes = int(faiss_index.ntotal * faiss_index.d * 4)
+    text_bytes = sum(len(t.encode("utf-8")) for t in ID_TO_TEXT.values())
+    return {
+        "index_type": type(faiss_index).__name__,
+        "ntotal": int(faiss_index.ntotal),
+        "dim": int(faiss_index.d),
+        "memory": {
+            "index_bytes": index_bytes,
+            "raw_vectors_bytes": vector_bytes,
+            "text_bytes": text_bytes,
+            "id_map_bytes": sys.getsizeof(ID_TO_TEXT)
+        },
+        "latency": {stage: histogram_summary(stage) for stage in STAGES}
+    }
+
+############################
+# Server & Client
+############################
+async def run_server():
+    # /metrics 同时暴露给Prometheus抓取
+    prometheus_port = 9101
+    print(f"Starting Prometheus metrics server on port {prometheus_port}...")
+    start_http_server(prometheus_port)
+    print("=== MCP服务器(faiss-vector-search-instrumented) 启动... ===")
+    app.run(transport="stdio")
+
+async def run_client():
+    print("=== 客户端等待5秒后启动... ===")
+    await asyncio.sleep(5)
+    server_params = StdioServerParameters(
+        command="python",
+        args=[os.path.abspath(__file__)]
+    )
+    async with stdio_client(server_params) as (read, write):
+        async with ClientSession(read, write) as session:
+            print("[Client] 初始化完成, 开始检索并查看统计")
+            await session.initialize()
+
+            for q in ["machine intelligence approach", "vector similarity", "context protocol"]:
+                await session.call_tool("tool_vector_search", {"query_text": q, "top_k": 3})
+
+            stats = await session.call_tool("index_stats", {})
+            print("[Client] 索引统计:", stats)
+
+async def main():
+    server_task = asyncio.create_task(run_server())
+    client_task = asyncio.create_task(run_client())
+    await asyncio.gather(server_task, client_task)
+
+if __name__ == "__main__":
+    asyncio.run(main())
+
+
+
+# 【例9-7】
+import os
+import sys
+import time
+import json
+import zlib
+import struct
+import random
+import asyncio
+import threading
+from contextlib import asynccontextmanager
+from typing import Dict, Any, List, Callable, Optional
+
+import mcp
+from mcp.server import FastMCP
+from mcp import ClientSession
+from mcp.client.stdio import stdio_client
+from mcp.client.stdio import StdioServerParameters
+
+#####################
+# Mock data & vector
+#####################
+DOCS_DB = [
+    "Cloud computing uses virtualized resources for dynamic scaling",
+    "A knowledge base can contain structured or unstructured data",
+    "MCP standardizes context passing between model and external tools",
+    "Vector search helps find semantically similar documents in large corpora",
+    "RAG stands for retrieval-augmented generation in language modeling",
+    "Slot mechanism in MCP organizes context in a structured manner"
+]
+
+def mock_text_to_vector(txt: str, dim: int = 16) -> List[float]:
+    seed = abs(hash(txt)) % (10**6)
+    rng = random.Random(seed)
+    return [rng.random() for _ in range(dim)]
+
+DOC_VECTORS = [(i, mock_text_to_vector(d), d) for i, d in enumerate(DOCS_DB)]
+
+def search_docs(query: str, top_k: int) -> List[Dict[str, Any]]:
+    qv = mock_text_to_vector(query)
+    results = []
+    for idx, vec, doc in DOC_VECTORS:
+        dist = sum((q - v)**2 for q, v in zip(qv, vec))**0.5
+        results.append({"doc_id": idx, "doc_text": doc, "dist": dist})
+    results.sort(key=lambda x: x["dist"])
+    return results[:top_k]
+
+#####################
+# Persistent slot store
+#####################
+# 快照文件格式(单文件, 通过os.replace原子替换):
+#   [8字节: 索引区偏移, 大端无符号整数]
+#   [记录区: 每个用户一条zlib压缩的紧凑JSON]
+#   [索引区: JSON {user_id: [offset, length]}]
+# 重启时只读取索引区, 用户数据在首次访问时按偏移懒加载
+_HEADER = struct.Struct(">Q")
+
+class PersistentSlotStore:
+    def __init__(self, path: str, factory: Callable[[], Dict[str, Any]]):
+        self.path = path
+        self.factory = factory
+        self._mem: Dict[str, Dict[str, Any]] = {}
+        self._dirty = set()
+        self._index: Dict[str, List[int]] = {}
+        self._lock = threading.Lock()
+        # 快照写入期间与下一次快照互斥, 不影响读写请求
+        self._snapshot_lock = threading.Lock()
+        self.loaded_from_disk = 0
+        self._load_index()
+
+    def _load_index(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "rb") as f:
+            index_offset = _HEADER.unpack(f.read(_HEADER.size))[0]
+            f.seek(index_offset)
+            self._index = json.loads(f.read().decode("utf-8"))
+
+    def _read_record(self, offset: int, length: int) -> bytes:
+        with open(self.path, "rb") as f:
+            f.seek(offset)
+            return f.read(length)
+
+    def get(self, user_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            slots = self._mem.get(user_id)
+            if slots is not None:
+                return slots
+            if user_id not in self._index:
+                return None
+            offset, length = self._index[user_id]
+            slots = json.loads(zlib.decompress(self._read_record(offset, length)).decode("utf-8"))
+            self._mem[user_id] = slots
+            self.loaded_from_disk += 1
+            return slots
+
+    def ensure(self, user_id: str) -> Dict[str, Any]:
+        slots = self.get(user_id)
+        if slots is None:
+            with self._lock:
+                slots = self._mem.setdefault(user_id, self.factory())
+                self._dirty.add(user_id)
+        return slots
+
+    def set(self, user_id: str, key: str, value: Any):
+        slots = self.ensure(user_id)
+        with self._lock:
+            slots[key] = value
+            self._dirty.add(user_id)
+
+    def __contains__(self, user_id: str) -> bool:
+        with self._lock:
+            return user_id in self._mem or user_id in self._index
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        持久化脏用户; 未变化用户直接拷贝旧快照中的压缩字节, 无需解码再编码
+        加锁阶段只做浅拷贝, 压缩与写盘在锁外完成
+        """
+        with self._snapshot_lock:
+            with self._lock:
+                dirty = {uid: dict(self._mem[uid]) for uid in self._dirty}
+                self._dirty.clear()
+                old_index = dict(self._index)
+            if not dirty:
+                return {"written_users": 0, "reused_users": len(old_index)}
+
+            try:
+                records: Dict[str, bytes] = {}
+                for uid, slots in dirty.items():
+                    raw = json.dumps(slots, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+                    records[uid] = zlib.compress(raw, 6)
+
+                tmp_path = self.path + ".tmp"
+                new_index: Dict[str, List[int]] = {}
+                old_file = open(self.path, "rb") if old_index else None
+                try:
+                    with open(tmp_path, "wb") as out:
+                        out.write(_HEADER.pack(0))
+                        for uid in set(old_index) | set(records):
+                            blob = records.get(uid)
+                            if blob is None:
+                                offset, length = old_index[uid]
+                                old_file.seek(offset)
+                                blob = old_file.read(length)
+                            new_index[uid] = [out.tell(), len(blob)]
+                            out.write(blob)
+                        index_offset = out.tell()
+                        out.write(json.dumps(new_index, separators=(",", ":")).encode("utf-8"))
+                        out.seek(0)
+                        out.write(_HEADER.pack(index_offset))
+                        out.flush()
+                        os.fsync(out.fileno())
+                finally:
+                    if old_file:
+                        old_file.close()
+                with self._lock:
+                    os.replace(tmp_path, self.path)
+                    self._index = new_index
+            except BaseException:
+                # 写盘失败时把本次取出的用户放回脏集合, 下次快照重试, 避免这些修改被静默丢弃
+                with self._lock:
+                    self._dirty.update(dirty)
+                try:
+                    os.remove(self.path + ".tmp")
+                except OSError:
+                    pass
+                raise
+            return {"written_users": len(records), "reused_users": len(new_index) - len(records)}
+
+    async def snapshot_loop(self, interval: float = 5.0):
+        """
+        周期性快照, 在线程池中执行, 不阻塞事件循环上的工具调用
+        """
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                stat = await asyncio.to_thread(self.snapshot)
+                if stat["written_users"]:
+                    print(f"[Snapshot] {self.path}: {stat}", file=sys.stderr)
+            except Exception as e:
+                print(f"[Snapshot] {self.path} 快照失败: {e}", file=sys.stderr)
+
+SNAPSHOT_DIR = os.getenv("RAG_SNAPSHOT_DIR", ".")
+
+# 例9-3的检索/选段slot
+RAG_SLOT_STORE = PersistentSlotStore(
+    os.path.join(SNAPSHOT_DIR, "rag_slot_store.snap"),
+    lambda: {"retrieval_slot": [], "selected_snippets_slot": []}
+)
+# 例9-4的结构化检索/注入slot
+SLOT_STORE = PersistentSlotStore(
+    os.path.join(SNAPSHOT_DIR, "slot_store.snap"),
+    lambda: {"structured_retrieval_slot": None, "final_inject_slot": None}
+)
+
+#####################
+# MCP server
+#####################
+@asynccontextmanager
+async def snapshot_lifespan(server: FastMCP):
+    """
+    在服务端自己的事件循环中启动周期性快照; 退出时停止后台任务并做最后一次快照
+    stdio传输占用标准输出, 快照日志写到stderr
+    """
+    stores = [RAG_SLOT_STORE, SLOT_STORE]
+    tasks = [asyncio.create_task(store.snapshot_loop(interval=5.0)) for store in stores]
+    try:
+        yield {}
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for store in stores:
+            try:
+                print(f"[Snapshot] {store.path} 退出前快照: {await asyncio.to_thread(store.snapshot)}",
+                      file=sys.stderr)
+            except Exception as e:
+                print(f"[Snapshot] {store.path} 退出前快照失败: {e}", file=sys.stderr)
+
+app = FastMCP("rag-slot-snapshot-demo", lifespan=snapshot_lifespan)
+
+@app.tool()
+def tool_vector_search(user_id: str, query: str, top_k: int = 3) -> Dict[str, Any]:
+    """
+    执行向量检索, 将结果写入user的retrieval_slot
+    """
+    results = [{"doc_text": h["doc_text"], "dist": h["dist"]} for h in search_docs(query, top_k)]
+    RAG_SLOT_STORE.set(user_id, "retrieval_slot", results)
+    return {"message": "retrieval done", "retrieved_count": len(results), "hits": results}
+
+@app.tool()
+def tool_select_snippets(user_id: str, limit_len: int = 50) -> Dict[str, Any]:
+    """
+    从retrieval_slot中选出若干片段; 重启后首次访问时从快照懒加载
+    """
+    slots = RAG_SLOT_STORE.get(user_id)
+    if slots is None:
+        return {"error": "no retrieval_slot found"}
+    chosen = []
+    used = 0
+    for r in slots["retrieval_slot"]:
+        token_count = len(r["doc_text"].split())
+        if used + token_count <= limit_len:
+            chosen.append(r["doc_text"])
+            used += token_count
+        else:
+            break
+    RAG_SLOT_STORE.set(user_id, "selected_snippets_slot", chosen)
+    return {"chosen_count": len(chosen), "chosen_texts": chosen}
+
+@app.tool()
+def tool_search_docs(user_id: str, query: str, top_k: int = 3) -> Dict[str, Any]:
+    """
+    结构化检索结果写入SLOT_STORE的structured_retrieval_slot
+    """
+    hits = [
+        {"doc_id": h["doc_id"], "rank": rank + 1, "score": round(h["dist"], 4), "text": h["doc_text"]}
+        for rank, h in enumerate(search_docs(query, top_k))
+    ]
+    SLOT_STORE.set(user_id, "structured_retrieval_slot", hits)
+    return {"status": "ok", "hits": hits}
+
+@app.tool()
+def tool_show_slots(user_id: str) -> Dict[str, Any]:
+    """
+    查看当前user_id对应的RAG slot内容
+    """
+    slots = RAG_SLOT_STORE.get(user_id)
+    if slots is None:
+        return {"error": "no slot store for given user"}
+    return slots
+
+@app.tool()
+async def tool_snapshot_now() -> Dict[str, Any]:
+    """
+    立即触发一次快照(例如滚动发布前的drain阶段); 压缩与fsync在线程中执行
+    """
+    return {"rag_slot_store": await asyncio.to_thread(RAG_SLOT_STORE.snapshot),
+            "slot_store": await asyncio.to_thread(SLOT_STORE.snapshot)}
+
+#####################
+# demonstration
+#####################
+async def run_server():
+    print("=== RAG slot快照演示服务器启动... ===")
+    # app.run会启动自己的事件循环, 周期性快照由snapshot_lifespan在该循环中启动
+    app.run(transport="stdio")
+
+async def run_client():
+    print("=== 客户端等待3秒后开始连接... ===")
+    await asyncio.sleep(3)
+    server_params = StdioServerParameters(
+        command="python",
+        args=[os.path.abspath(__file__)]
+    )
+    user_id = "user_abc"
+    # 第一次连接: 检索并显式快照
+    async with stdio_client(server_params) as (read, write):
+        async with ClientSession(read, write) as session:
+            await session.initialize()
+            res1 = await session.call_tool("tool_vector_search", {
+                "user_id": user_id,
+                "query": "transformer approach in data usage",
+                "top_k": 5
+            })
+            print("[Client] 向量检索结果:", res1)
+            snap = await session.call_tool("tool_snapshot_now", {})
+            print("[Client] 快照结果:", snap)
+
+    # 第二次连接相当于服务器重启: 无需重新检索, 直接从快照恢复retrieval_slot
+    async with stdio_client(server_params) as (read, write):
+        async with ClientSession(read, write) as session:
+            await session.initialize()
+            res2 = await session.call_tool("tool_select_snippets", {
+                "user_id": user_id,
+                "limit_len": 20
+            })
+            print("[Client] 重启后片段选择:", res2)
+            slot_view = await session.call_tool("tool_show_slots", {"user_id": user_id})
+            print("[Client] slot内容:", slot_view)
+
 async def main():
     server_task = asyncio.create_task(run_server())
     client_task = asyncio.create_task(run_client())